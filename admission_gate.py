@@ -0,0 +1,139 @@
+import asyncio
+import math
+from collections import deque
+
+class Overloaded(Exception):
+    # The wait queue is full, or the wait for a slot took too long
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class DeadlineExceeded(Exception):
+    pass
+
+class ClientDisconnected(Exception):
+    pass
+
+# Admission control in front of the LLM. At most max_concurrency requests run
+# model work at a time and at most max_queue wait for a slot; past that a
+# request is rejected at once (Overloaded, i.e. 429 + Retry-After) instead of
+# piling up behind the model until its client times out. Admitted work is
+# cancelled when its deadline passes or its client disconnects, which also
+# cancels its prompt if it is still queued in BatchingLLaMA (a prompt already
+# in a running generate call finishes, its result is dropped).
+# Used from the event loop only, so plain counters are enough.
+class AdmissionGate:
+    # Weight of the latest request in the running average of service time
+    SERVICE_TIME_WEIGHT = 0.2
+
+    def __init__(self, max_concurrency=8, max_queue=32, queue_timeout=10.0, disconnect_poll=0.5):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.disconnect_poll = disconnect_poll
+        self.active = 0
+        self._waiters = deque()
+        self._service_time = None
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.deadline_exceeded = 0
+        self.disconnected = 0
+
+    def retry_after(self):
+        # Seconds until the queue ahead has likely drained at the observed service time
+        service_time = self._service_time or 1.0
+        return max(1, math.ceil(service_time * (len(self._waiters) + 1) / self.max_concurrency))
+
+    def check(self):
+        # Rejects, without queueing, a request that acquire() would reject right
+        # away; for callers that must answer before they can wait (streams)
+        if self.active >= self.max_concurrency and len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded("Too many LLM requests waiting, try again later", self.retry_after())
+
+    async def acquire(self, timeout=None):
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        self.check()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as this request gave up: pass it on
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise Overloaded("Timed out waiting for the LLM, try again later", self.retry_after())
+            raise
+        self.admitted += 1
+
+    def release(self):
+        # Hands the slot straight to the next waiter, if any is still waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    async def run(self, work, is_disconnected=None, timeout=None):
+        # Runs work() (a coroutine function) once admitted. timeout is the request's
+        # whole budget (waiting included); is_disconnected is polled while it runs,
+        # e.g. Request.is_disconnected.
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        await self.acquire(timeout)
+        started = loop.time()
+        task = asyncio.ensure_future(work())
+        try:
+            while True:
+                wait = self.disconnect_poll if is_disconnected is not None else None
+                if deadline is not None:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        self.deadline_exceeded += 1
+                        raise DeadlineExceeded(f"LLM request did not finish within {timeout:g}s")
+                    wait = remaining if wait is None else min(wait, remaining)
+                done, _ = await asyncio.wait({task}, timeout=wait)
+                if done:
+                    break
+                if is_disconnected is not None and await is_disconnected():
+                    self.disconnected += 1
+                    raise ClientDisconnected()
+            result = task.result()
+            self._record_service_time(loop.time() - started)
+            return result
+        finally:
+            if not task.done():
+                task.cancel()
+            self.release()
+
+    def _record_service_time(self, seconds):
+        if self._service_time is None:
+            self._service_time = seconds
+        else:
+            self._service_time += self.SERVICE_TIME_WEIGHT * (seconds - self._service_time)
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'queued': len(self._waiters),
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'queue_timeout_seconds': self.queue_timeout,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'deadline_exceeded': self.deadline_exceeded,
+            'disconnected': self.disconnected,
+            'avg_service_ms': round(1000 * self._service_time, 1) if self._service_time is not None else None,
+        }
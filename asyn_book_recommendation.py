@@ -1,65 +1,300 @@
+import asyncio
+import functools
+import time
+from collections import namedtuple
+import numpy as np
 import pandas as pd
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from database import async_engine, AsyncSessionLocal, engine_options
 from sqlalchemy.future import select
-from sqlalchemy import text
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
+from item_similarity import ItemNeighbors
+from models import Review
+from metrics import RECOMMENDER_STAGE_SECONDS, record_snapshot, timed
+from recommender_snapshot import CompactBooks, SnapshotStore, build_genre_index, fit_rating_model, projection_query
+
+# Immutable result of one load + train cycle. Requests only ever read the
+# current snapshot; the refresher builds a new one and swaps the reference.
+RecommendationSnapshot = namedtuple('RecommendationSnapshot', ['version', 'books', 'model', 'index', 'items', 'built_at'])
 
 class BookRecommendation:
-    def __init__(self, database_url):
-        self.engine = create_async_engine(database_url, echo=True)
-        self.session = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
-        self.df = None
-        self.model = None
+    # With a snapshot directory, how often a worker checks for a snapshot built by another worker
+    SNAPSHOT_POLL_SECONDS = 30
+    # An incremental refresh touching more than this share of the rows rebuilds instead
+    MAX_INCREMENTAL_FRACTION = 0.2
+
+    def __init__(self, database_url=None, refresh_interval=3600, neighbors_per_book=50, snapshot_dir=None,
+                 watermark_column=None, key_column=None, deleted_column=None, full_refresh_every=24):
+        # Uses the shared engine unless pointed at a different database
+        if database_url:
+            self.engine = create_async_engine(database_url, **engine_options(database_url))
+            self.session = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        else:
+            self.engine = async_engine
+            self.session = AsyncSessionLocal
+        self.refresh_interval = refresh_interval
+        self.neighbors_per_book = neighbors_per_book
+        # Optional on-disk snapshot shared by the workers on this host, memory-mapped read-only
+        self.store = SnapshotStore(snapshot_dir) if snapshot_dir else None
+        # Incremental refresh: with a watermark column (an updated-at timestamp,
+        # or a key that only grows for append-only tables) refreshes read just
+        # the book_rating rows changed since the last one, matched to the rows
+        # already loaded by key_column. Deletes are seen through the optional
+        # soft-delete column; every full_refresh_every refreshes the data is
+        # rebuilt from scratch anyway, which also picks up hard deletes, new
+        # reviews for the item neighbours and retrains the model.
+        if watermark_column and not key_column:
+            # An updated-at watermark can't identify a row: every update would
+            # be appended as a new book. Pass the watermark column as the key
+            # only when it is an id that only grows.
+            raise ValueError("key_column is required with watermark_column")
+        self.watermark_column = watermark_column
+        self.key_column = key_column
+        self.deleted_column = deleted_column
+        self.full_refresh_every = full_refresh_every
+        self._incremental_refreshes = 0
+        self._snapshot_path = None
+        self.snapshot = None
+        self._refresh_requested = None
+        self._refresh_task = None
+
+    @property
+    def df(self):
+        return self.snapshot.books.to_frame() if self.snapshot else None
 
+    @property
+    def model(self):
+        return self.snapshot.model if self.snapshot else None
+
+    @timed(RECOMMENDER_STAGE_SECONDS, stage='load_data')
     async def load_data(self):
+        # Only the columns the recommender reads
         async with self.session() as session:
             async with session.begin():
-                result = await session.execute(text("SELECT * FROM book_rating"))
+                query = projection_query(self.key_column, self.watermark_column, self.deleted_column)
+                result = await session.execute(query)
                 data = result.fetchall()
-        
-        self.df = pd.DataFrame(data, columns=result.keys())
-        rating_columns = ['RatingDist1', 'RatingDist2', 'RatingDist3', 'RatingDist4', 'RatingDist5']
-        for col in rating_columns:
-            self.df[col] = pd.to_numeric(self.df[col], errors='coerce')
+                columns = list(result.keys())
+
+        # Building the compact frame is CPU work, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, CompactBooks.from_rows, data, columns)
+
+    @timed(RECOMMENDER_STAGE_SECONDS, stage='load_changes')
+    async def load_changes(self, since):
+        # book_rating rows changed at or after the since watermark
+        async with self.session() as session:
+            async with session.begin():
+                query = projection_query(self.key_column, self.watermark_column, self.deleted_column, changed_since=True)
+                result = await session.execute(query, {'since': since})
+                return result.fetchall(), list(result.keys())
+
+    @timed(RECOMMENDER_STAGE_SECONDS, stage='load_reviews')
+    async def load_reviews(self, chunk_size=100000):
+        # (user_id, book_id, rating) columns of the reviews table as numpy arrays,
+        # read through a server-side cursor one chunk at a time
+        user_ids, book_ids, ratings = [], [], []
+        query = (
+            select(Review.user_id, Review.book_id, Review.rating)
+            .where(Review.user_id.isnot(None), Review.book_id.isnot(None), Review.rating.isnot(None))
+        )
+        async with self.session() as session:
+            result = await session.stream(query)
+            async for rows in result.partitions(chunk_size):
+                columns = np.array(rows, dtype=np.float64).reshape(-1, 3)
+                user_ids.append(columns[:, 0].astype(np.int64))
+                book_ids.append(columns[:, 1].astype(np.int64))
+                ratings.append(columns[:, 2].astype(np.float32))
+        if not ratings:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+        return np.concatenate(user_ids), np.concatenate(book_ids), np.concatenate(ratings)
+
+    @timed(RECOMMENDER_STAGE_SECONDS, stage='build_item_neighbors')
+    async def build_item_neighbors(self, user_ids, book_ids, ratings):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, ItemNeighbors, user_ids, book_ids, ratings, self.neighbors_per_book)
+
+    @timed(RECOMMENDER_STAGE_SECONDS, stage='train_model')
+    async def train_model(self, books):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fit_rating_model, books)
+
+    @timed(RECOMMENDER_STAGE_SECONDS, stage='build_index')
+    async def build_index(self, books):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, build_genre_index, books)
+
+    async def refresh(self, force=False):
+        if self.store is None:
+            return await self._rebuild(force)
 
-        self.df.dropna(subset=['Rating'] + rating_columns, inplace=True)
-        self.df['AverageRating'] = self.df[rating_columns].mean(axis=1)
-        self.df['Genre'] = self.df['Genre'].str.lower()
+        # Shared snapshot: map a recent one if there is one, otherwise rebuild it
+        # (one worker at a time) and map the result
+        loop = asyncio.get_running_loop()
+        stored = None if force else await loop.run_in_executor(None, self.store.fresh, self.refresh_interval)
+        if stored is None:
+            if await loop.run_in_executor(None, self.store.acquire):
+                try:
+                    stored = None if force else self.store.fresh(self.refresh_interval)
+                    if stored is None:
+                        return await self._rebuild(force)
+                finally:
+                    self.store.release()
+            else:
+                stored = await loop.run_in_executor(None, self.store.wait_for_build)
+        if stored is None:
+            raise RuntimeError("No recommendation snapshot available")
+        return await self._map_snapshot(*stored)
 
-    async def train_model(self):
-        if self.df is None:
-            await self.load_data()
+    def _can_refresh_incrementally(self):
+        snapshot = self.snapshot
+        return (
+            self.watermark_column is not None
+            and snapshot is not None
+            and snapshot.books.keys is not None
+            and snapshot.books.watermark is not None
+            and self._incremental_refreshes < self.full_refresh_every
+        )
 
-        X = self.df[['Genre']]
-        y = self.df['AverageRating']
+    async def _rebuild(self, force=False):
+        if not force and self._can_refresh_incrementally():
+            snapshot = await self._refresh_incrementally()
+            if snapshot is not None:
+                return snapshot
+        books = await self.load_data()
+        model = await self.train_model(books)
+        index = await self.build_index(books)
+        items = await self.build_item_neighbors(*await self.load_reviews())
+        print(f"Recommendation data built from {len(books)} rows and {items.review_count} reviews")
+        self._incremental_refreshes = 0
+        return await self._publish(books, model, index, items)
 
-        label_encoder = LabelEncoder()
-        X['GenreEncoded'] = label_encoder.fit_transform(X['Genre'])
+    @timed(RECOMMENDER_STAGE_SECONDS, stage='incremental_refresh')
+    async def _refresh_incrementally(self):
+        # Patches the current snapshot with the rows changed since its watermark;
+        # None when there are too many changes for that to pay off
+        snapshot = self.snapshot
+        rows, columns = await self.load_changes(snapshot.books.watermark)
+        if len(rows) > max(1, snapshot.books.row_count) * self.MAX_INCREMENTAL_FRACTION:
+            print(f"{len(rows)} changed rows, rebuilding recommendation data in full")
+            return None
+        loop = asyncio.get_running_loop()
+        books, index = await loop.run_in_executor(None, self._apply_changes, snapshot, rows, columns)
+        self._incremental_refreshes += 1
+        print(f"Recommendation data patched with {len(rows)} changed rows")
+        # The model and item neighbours are only rebuilt by a full refresh
+        return await self._publish(books, snapshot.model, index, snapshot.items, patched=snapshot)
 
-        X_train, X_test, y_train, y_test = train_test_split(X[['GenreEncoded']], y, test_size=0.2, random_state=42)
-        self.model = RandomForestRegressor(n_estimators=100, random_state=42)
-        self.model.fit(X_train, y_train)
+    @staticmethod
+    def _apply_changes(snapshot, rows, columns):
+        books, removed, added = snapshot.books.apply_changes(rows, columns)
+        removed_codes = snapshot.books.genre_codes[removed]
+        index = snapshot.index.patched(books.genres, books.genre_codes, books.ratings, removed, removed_codes, added)
+        return books, index
 
-    async def recommend_books(self, genre, min_rating):
-        if self.df is None:
-            await self.load_data()
+    async def _publish(self, books, model, index, items, patched=None):
+        # patched: the snapshot an incremental refresh started from
+        version = self.snapshot.version + 1 if self.snapshot else 1
+        if self.store is not None:
+            current = self.store.current()
+            if current is not None:
+                version = max(version, current[1]['version'] + 1)
+            previous = None
+            if patched is not None and self._snapshot_path is not None:
+                previous = (patched.books, patched.index, patched.model, patched.items)
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            path, built_at = await loop.run_in_executor(
+                None, functools.partial(self.store.save, version, books, index, model, items, previous, self._snapshot_path)
+            )
+            RECOMMENDER_STAGE_SECONDS.labels('save_snapshot').observe(time.perf_counter() - started)
+            # Serve from the mapped files like every other worker
+            return await self._map_snapshot(path, {'version': version, 'built_at': built_at}, books)
+        # Single reference assignment, so readers see either the old or the new snapshot
+        self.snapshot = RecommendationSnapshot(version, books, model, index, items, time.time())
+        record_snapshot(self.snapshot)
+        print(f"Recommendation snapshot v{version} ready")
+        return self.snapshot
 
-        await self.train_model()  # Ensure model is trained before making recommendations
+    async def _map_snapshot(self, path, meta, saved_books=None):
+        # saved_books: the in-memory books just saved to path by this worker
+        if path == self._snapshot_path:
+            return self.snapshot
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        books, index, model, items = await loop.run_in_executor(None, self.store.load, path, ItemNeighbors.load)
+        RECOMMENDER_STAGE_SECONDS.labels('map_snapshot').observe(time.perf_counter() - started)
+        if saved_books is not None:
+            # Same rows, so the key and name lookups still hold; rebuilding them
+            # would make the next incremental refresh cost a pass over the table
+            books._positions = saved_books._positions
+            books._name_lookup = saved_books._name_lookup
+        self.snapshot = RecommendationSnapshot(meta['version'], books, model, index, items, meta['built_at'])
+        record_snapshot(self.snapshot)
+        self._snapshot_path = path
+        print(f"Recommendation snapshot v{meta['version']} mapped from {path}")
+        return self.snapshot
 
-        genre_lower = genre.lower()
-        possible_genres = self.df[self.df['Genre'].str.contains(genre_lower, na=False)]
+    def start_background_refresh(self):
+        if self._refresh_task is None:
+            self._refresh_requested = asyncio.Event()
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop_background_refresh(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    def invalidate(self):
+        # Ask the refresher to rebuild now instead of waiting for the next tick
+        if self._refresh_requested is not None:
+            self._refresh_requested.set()
+
+    async def _refresh_loop(self):
+        force = False
+        # With a shared snapshot, wake up often enough to pick up other workers' builds
+        interval = min(self.refresh_interval, self.SNAPSHOT_POLL_SECONDS) if self.store else self.refresh_interval
+        while True:
+            self._refresh_requested.clear()
+            try:
+                await self.refresh(force)
+            except Exception as e:
+                # Keep serving the previous snapshot if a rebuild fails
+                print(f"Recommendation refresh failed: {e}")
+            try:
+                await asyncio.wait_for(self._refresh_requested.wait(), timeout=interval)
+                force = True
+            except asyncio.TimeoutError:
+                force = False
+
+    async def recommend_books(self, genre, min_rating, limit=None):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"message": "Recommendations are still being prepared. Please try again shortly."}
 
         # Check if any books are found for the specified genre
-        if possible_genres.empty:
+        if not snapshot.index.matching_genres(genre):
             return {"message": "No books found for the specified genre. Please try a different genre."}
 
-        recommendations = possible_genres[possible_genres['AverageRating'] >= min_rating]
+        positions = snapshot.index.lookup(genre, min_rating, limit)
+        recommendations = pd.DataFrame({'Name': snapshot.books.names(positions)})
 
         # Check if any recommendations are found
         if recommendations.empty:
             return {"message": "No recommendations found. Consider lowering the minimum rating or trying another genre."}
         
         return recommendations[['Name']]
+
+    async def recommend_for_user(self, user_id, limit=10):
+        # Personalized picks from the item-item neighbours: [(book_id, predicted_rating, support)]
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"message": "Recommendations are still being prepared. Please try again shortly."}
+        recommendations = snapshot.items.recommend(user_id, limit)
+        if not recommendations:
+            return {"message": "No personalized recommendations yet. Review a few books first."}
+        return recommendations
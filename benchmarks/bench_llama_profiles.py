@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# Compares LLaMAQuick inference profiles on this machine. Each profile runs in a
+# fresh subprocess so peak RSS is measured per profile, and the parent prints one
+# JSON object per profile:
+#   python benchmarks/bench_llama_profiles.py /path/to/model --profiles quality fast
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROMPTS = [
+    "The book The Hobbit by J.R.R. Tolkien is a fantasy published in 1937.",
+    "The book Dune by Frank Herbert is a science fiction published in 1965.",
+    "The book Pride and Prejudice by Jane Austen is a romance published in 1813.",
+    "The book Dracula by Bram Stoker is a horror published in 1897.",
+]
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_profile(model_path, profile, num_threads, max_length, rounds):
+    from llama_quick import LLaMAQuick
+
+    started = time.perf_counter()
+    model = LLaMAQuick(model_path, profile=profile, num_threads=num_threads)
+    load_seconds = time.perf_counter() - started
+
+    generated_tokens = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for prompt in PROMPTS:
+            text = model.generate_text(prompt, max_length=max_length)
+            prompt_tokens = len(model.tokenizer(prompt)['input_ids'])
+            generated_tokens += max(len(model.tokenizer(text)['input_ids']) - prompt_tokens, 0)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'profile': profile,
+        'num_threads': num_threads,
+        'load_and_warmup_seconds': round(load_seconds, 3),
+        'requests': rounds * len(PROMPTS),
+        'generated_tokens': generated_tokens,
+        'seconds': round(elapsed, 3),
+        'tokens_per_second': round(generated_tokens / elapsed, 2) if elapsed else 0.0,
+        'seconds_per_request': round(elapsed / (rounds * len(PROMPTS)), 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+def main():
+    from llama_quick import INFERENCE_PROFILES
+
+    parser = argparse.ArgumentParser(description="Benchmark LLaMAQuick inference profiles")
+    parser.add_argument('model_path')
+    parser.add_argument('--profiles', nargs='+', default=sorted(INFERENCE_PROFILES))
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--max-length', type=int, default=150)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--run-profile', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        print(json.dumps(run_profile(args.model_path, args.run_profile, args.threads, args.max_length, args.rounds)))
+        return
+
+    for profile in args.profiles:
+        command = [sys.executable, __file__, args.model_path, '--run-profile', profile,
+                   '--max-length', str(args.max_length), '--rounds', str(args.rounds)]
+        if args.threads:
+            command += ['--threads', str(args.threads)]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(json.dumps({'profile': profile, 'error': result.stderr.strip().splitlines()[-1:]}))
+            continue
+        print(result.stdout.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    main()
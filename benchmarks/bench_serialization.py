@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Compares the old and new read path for a large GET /books/ response:
+#   orm:  select(Book) into ORM instances, jsonable_encoder, JSONResponse (stdlib json)
+#   rows: Core select into BookRow (BookManager.get_all_books), ORJSONResponse
+# Each path is run --rounds times against a throwaway SQLite database and one
+# JSON object per path is printed (median milliseconds per stage):
+#   python benchmarks/bench_serialization.py --rows 10000
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from models import Base, Book
+from asyn_book_manager import BookManager
+
+async def load_orm(session):
+    result = await session.execute(select(Book).order_by(Book.id))
+    return result.scalars().all()
+
+def encode_orm(books):
+    return JSONResponse(jsonable_encoder(books)).body
+
+async def load_rows(session):
+    return await BookManager(session, None).get_all_books()
+
+def encode_rows(books):
+    return ORJSONResponse(books).body
+
+async def measure(engine, load, encode, rounds):
+    load_ms, encode_ms = [], []
+    for _ in range(rounds):
+        # A fresh session per round, as each request gets
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            started = time.perf_counter()
+            books = await load(session)
+            loaded = time.perf_counter()
+            body = encode(books)
+            encoded = time.perf_counter()
+        load_ms.append((loaded - started) * 1000)
+        encode_ms.append((encoded - loaded) * 1000)
+    return {
+        'rows': len(books),
+        'bytes': len(body),
+        'load_ms': round(statistics.median(load_ms), 2),
+        'encode_ms': round(statistics.median(encode_ms), 2),
+        'total_ms': round(statistics.median(l + e for l, e in zip(load_ms, encode_ms)), 2),
+    }
+
+async def run(rows, rounds):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{directory}/bench.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(Book), [
+                {
+                    'id': i,
+                    'title': f"Book {i}",
+                    'author': f"Author {i % 500}",
+                    'genre': ('fantasy', 'romance', 'science fiction', 'horror')[i % 4],
+                    'year_published': 1900 + i % 120,
+                    'summary': f"A summary of book {i}, long enough to look like a real one. " * 3,
+                    'summary_status': 'ready',
+                }
+                for i in range(1, rows + 1)
+            ])
+        results = {}
+        for path, load, encode in (('orm', load_orm, encode_orm), ('rows', load_rows, encode_rows)):
+            results[path] = await measure(engine, load, encode, rounds)
+            print(json.dumps({'path': path, **results[path]}))
+        await engine.dispose()
+        print(json.dumps({
+            'speedup_total': round(results['orm']['total_ms'] / results['rows']['total_ms'], 2),
+            'speedup_encode': round(results['orm']['encode_ms'] / results['rows']['encode_ms'], 2),
+        }))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ORM vs row/orjson serialization of large book lists")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.rounds))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+# End-to-end HTTP load test. Boots app.py and/or book_management_app.py under
+# uvicorn in a subprocess, against a throwaway SQLite database seeded with
+# synthetic books, reviews and book_rating rows, with a deterministic stub in
+# place of LLaMAQuick. Each route is then driven by --concurrency clients for
+# --duration seconds, and one JSON report (throughput and p50/p95/p99 latency
+# per route) is printed, so runs can be compared across commits:
+#   python benchmarks/load_test.py --books 5000 --reviews 50000 --concurrency 16 --duration 10 > before.json
+#   python benchmarks/load_test.py --apps book_management_app --routes "GET /books" --output after.json
+# --database-url points the apps at another database (e.g. a local Postgres)
+# instead; its books, reviews and book_rating tables are dropped and reseeded.
+# The client side needs httpx.
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+APPS = ['app', 'book_management_app']
+GENRES = ['Fantasy', 'Science Fiction', 'Romance', 'Horror', 'Mystery', 'History', 'Poetry', 'Children']
+WORDS = [
+    'river', 'shadow', 'empire', 'garden', 'winter', 'machine', 'letter', 'island',
+    'crown', 'forest', 'signal', 'harbor', 'mirror', 'storm', 'lantern', 'orbit',
+]
+# Components a route may need; the load starts once all of them report ready
+REQUIRED_COMPONENTS = 'llm,recommender,similar'
+
+# Deterministic stand-in for LLaMAQuick: the text depends only on the prompt,
+# and each call sleeps like a model would (a fixed cost plus a cost per token;
+# a batch pays the fixed cost once)
+class StubLLaMA:
+    model_path = 'stub'
+    model_identity = 'stub'
+
+    def __init__(self, call_ms=50, token_ms=2, tokens=32):
+        self.call_ms = call_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+
+    def _words(self, prompt, max_length):
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+        return [WORDS[digest[i % len(digest)] % len(WORDS)] for i in range(min(self.tokens, max_length))]
+
+    def generate_text(self, prompt, max_length=150, num_beams=None):
+        words = self._words(prompt, max_length)
+        time.sleep((self.call_ms + self.token_ms * len(words)) / 1000)
+        return ' '.join(words)
+
+    def generate_batch(self, prompts, max_length=150, num_beams=None):
+        batch = [self._words(prompt, max_length) for prompt in prompts]
+        time.sleep((self.call_ms + self.token_ms * max(len(words) for words in batch)) / 1000)
+        return [' '.join(words) for words in batch]
+
+    def stream_text(self, prompt, max_length=150, cancel_event=None):
+        time.sleep(self.call_ms / 1000)
+        for word in self._words(prompt, max_length):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            time.sleep(self.token_ms / 1000)
+            yield word + ' '
+
+## Seeding
+
+def synthetic_text(rng, words):
+    return ' '.join(WORDS[i] for i in rng.integers(0, len(WORDS), words))
+
+def seed_database(database_url, books, reviews, ratings, users, seed):
+    from sqlalchemy import create_engine, insert, text
+    from database import sync_url
+    from models import Base, Book, Review, BookRatingStats
+
+    rng = np.random.default_rng(seed)
+    engine = create_engine(sync_url(database_url))
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS book_rating'))
+
+    genres = rng.integers(0, len(GENRES), books)
+    book_rows = [
+        {
+            'id': book_id,
+            'title': f"The {synthetic_text(rng, 2).title()} {book_id}",
+            'author': f"Author {book_id % 997}",
+            'genre': GENRES[genres[book_id - 1]],
+            'year_published': int(1900 + book_id % 120),
+            'summary': synthetic_text(rng, 30),
+            'summary_status': 'ready',
+        }
+        for book_id in range(1, books + 1)
+    ]
+    review_books = rng.integers(1, books + 1, reviews)
+    review_users = rng.integers(1, users + 1, reviews)
+    review_ratings = rng.integers(1, 6, reviews)
+    review_rows = [
+        {'id': review_id + 1, 'book_id': int(book_id), 'user_id': int(user_id), 'review_text': synthetic_text(rng, 12), 'rating': float(rating)}
+        for review_id, (book_id, user_id, rating) in enumerate(zip(review_books, review_users, review_ratings))
+    ]
+    # Same aggregates BookManager.rebuild_rating_stats would compute (integer ratings bucket exactly)
+    stats = pd.DataFrame({'book_id': review_books, 'rating': review_ratings})
+    stats_rows = [
+        {
+            'book_id': int(book_id),
+            'review_count': len(group),
+            'rating_sum': float(group.sum()),
+            **{f'rating_{star}': int((group == star).sum()) for star in range(1, 6)},
+        }
+        for book_id, group in stats.groupby('book_id')['rating']
+    ]
+    with engine.begin() as conn:
+        for table, rows in ((Book.__table__, book_rows), (Review.__table__, review_rows), (BookRatingStats.__table__, stats_rows)):
+            for start in range(0, len(rows), 10000):
+                conn.execute(insert(table), rows[start:start + 10000])
+
+    rating_dist = {f'RatingDist{star}': rng.integers(0, 500, ratings).astype(str) for star in range(1, 6)}
+    pd.DataFrame({
+        'Id': np.arange(1, ratings + 1),
+        'Name': [f"Rated {synthetic_text(rng, 2)} {i}" for i in range(ratings)],
+        'Authors': [f"Author {i % 997}" for i in range(ratings)],
+        'Genre': np.array(GENRES)[rng.integers(0, len(GENRES), ratings)],
+        'Rating': np.round(rng.random(ratings) * 4 + 1, 2),
+        **rating_dist,
+    }).to_sql('book_rating', engine, index=False, chunksize=10000)
+    engine.dispose()
+
+## Routes
+
+# Builds the requests for one app run: every route is a (name, factory) pair and
+# the factory returns (method, path, json body) for one request
+class RequestFactory:
+    def __init__(self, books, reviews, users, seed):
+        self.books = books
+        self.users = users
+        self.rng = random.Random(seed)
+        # Ids for rows created during the run, past the seeded ones
+        self.new_book_ids = itertools.count(books + 1)
+        self.new_review_ids = itertools.count(reviews + 1)
+        self.prompts = itertools.count(1)
+
+    def book_id(self):
+        return self.rng.randint(1, self.books)
+
+    def book(self, book_id, summary=True):
+        return {
+            'ID': book_id,
+            'Title': f"Load test book {book_id}",
+            'Author': 'Load Tester',
+            'Genre': self.rng.choice(GENRES),
+            'Year_Published': 2000,
+            'Summary': f"Summary of load test book {book_id}" if summary else None,
+        }
+
+    def routes(self, app_name):
+        rng = self.rng
+        routes = [
+            ('GET /books/{id}', lambda: ('GET', f"/books/{self.book_id()}", None)),
+            ('GET /books/?ids=', lambda: ('GET', "/books/?ids=" + ",".join(str(self.book_id()) for _ in range(20)), None)),
+            ('GET /books/search', lambda: ('GET', f"/books/search?q={rng.choice(WORDS)}+{rng.choice(WORDS)}&limit=20", None)),
+            ('GET /books/{id}/similar', lambda: ('GET', f"/books/{self.book_id()}/similar", None)),
+            ('GET /books/{id}/reviews/', lambda: ('GET', f"/books/{self.book_id()}/reviews/", None)),
+            ('POST /reviews/batch', lambda: ('POST', "/reviews/batch", {'book_ids': [self.book_id() for _ in range(20)]})),
+            ('GET /books/{id}/summary/', lambda: ('GET', f"/books/{self.book_id()}/summary/", None)),
+            ('POST /recommendations/', lambda: ('POST', "/recommendations/", {'genre': rng.choice(GENRES), 'min_rating': rng.choice([2.0, 3.0, 4.0]), 'limit': 10})),
+            ('POST /books/{id}/reviews/', self.new_review),
+            ('PUT /books/{id}', self.update_book),
+            ('POST /books/', lambda: ('POST', "/books/", self.book(next(self.new_book_ids)))),
+            ('POST /books/ (no summary)', lambda: ('POST', "/books/", self.book(next(self.new_book_ids), summary=False))),
+        ]
+        if app_name == 'app':
+            routes += [
+                ('GET /books/', lambda: ('GET', "/books/", None)),
+                ('POST /generate-summary/', lambda: ('POST', "/generate-summary/", {'content': f"Synthetic book content {next(self.prompts)}"})),
+                ('POST /generate-summary/stream', lambda: ('POST', "/generate-summary/stream", {'content': f"Synthetic book content {next(self.prompts)}"})),
+            ]
+        else:
+            routes += [
+                ('GET /books/?limit=50&after=', lambda: ('GET', f"/books/?limit=50&after={self.book_id()}", None)),
+                ('GET /users/{user_id}/recommendations', lambda: ('GET', f"/users/{rng.randint(1, self.users)}/recommendations", None)),
+            ]
+        return routes
+
+    def update_book(self):
+        book_id = self.book_id()
+        return 'PUT', f"/books/{book_id}", self.book(book_id)
+
+    def new_review(self):
+        book_id = self.book_id()
+        review = {'ID': next(self.new_review_ids), 'Book_ID': book_id, 'User_ID': self.rng.randint(1, self.users), 'Review_Text': 'Load test review', 'Rating': float(self.rng.randint(1, 5))}
+        return 'POST', f"/books/{book_id}/reviews/", review
+
+## Load
+
+def summarize(latencies, statuses, elapsed):
+    latencies = np.array(latencies) * 1000
+    # statuses are HTTP codes, or the exception name for requests that got no response
+    ok = sum(count for status, count in statuses.items() if status.startswith('2'))
+    report = {
+        'requests': len(latencies),
+        'errors': len(latencies) - ok,
+        'status': dict(sorted(statuses.items())),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        report['latency_ms'] = {
+            'p50': round(float(p50), 2),
+            'p95': round(float(p95), 2),
+            'p99': round(float(p99), 2),
+            'max': round(float(latencies.max()), 2),
+            'mean': round(float(latencies.mean()), 2),
+        }
+    return report
+
+async def drive(client, factory, concurrency, duration, warmup, headers):
+    # Closed loop: each client sends its next request as soon as the previous one
+    # answers. Requests started during the warm-up are not recorded.
+    latencies = []
+    statuses = {}
+    started = time.perf_counter()
+    record_from = started + warmup
+    stop_at = record_from + duration
+
+    async def client_loop():
+        while time.perf_counter() < stop_at:
+            method, path, body = factory()
+            sent = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body, headers=headers)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            if sent >= record_from:
+                latencies.append(time.perf_counter() - sent)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - record_from)
+
+async def wait_until_ready(client, process, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            response = await client.get(f"/readyz?require={REQUIRED_COMPONENTS}")
+            if response.status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+async def load_app(app_name, base_url, process, args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await wait_until_ready(client, process, args.startup_timeout)
+        startup_seconds = time.perf_counter() - started
+        headers = {}
+        if app_name == 'book_management_app':
+            token = (await client.post("/token", params={'username': 'loadtest'})).json()['access_token']
+            headers['Authorization'] = f"Bearer {token}"
+
+        factory = RequestFactory(args.books, args.reviews, args.users, args.seed)
+        routes = {}
+        for name, make_request in factory.routes(app_name):
+            if args.routes and not any(selected in name for selected in args.routes):
+                continue
+            print(f"{app_name}: {name}", file=sys.stderr)
+            routes[name] = await drive(client, make_request, args.concurrency, args.duration, args.warmup, headers)
+        return {'startup_seconds': round(startup_seconds, 2), 'routes': routes}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def run_app(app_name, database_url, workdir, args):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, LLAMA_MODEL_PATH='stub')
+    log_path = os.path.join(workdir, f"{app_name}.log")
+    command = [
+        sys.executable, os.path.abspath(__file__), 'serve', app_name, '--port', str(port),
+        '--llm-call-ms', str(args.llm_call_ms), '--llm-token-ms', str(args.llm_token_ms), '--llm-tokens', str(args.llm_tokens),
+    ]
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, env=env, cwd=REPO, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            return asyncio.run(load_app(app_name, f"http://127.0.0.1:{port}", process, args))
+        except Exception as e:
+            raise RuntimeError(f"{app_name}: {e} (server log: {log_path})") from e
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    try:
+        template = os.path.join(workdir, 'seed.db')
+        started = time.perf_counter()
+        seed_database(args.database_url or f"sqlite:///{template}", args.books, args.reviews, args.ratings, args.users, args.seed)
+        seed_seconds = time.perf_counter() - started
+
+        apps = {}
+        for app_name in args.apps:
+            if args.database_url:
+                if apps:
+                    # Undo the previous app's writes so every app sees the same data
+                    seed_database(args.database_url, args.books, args.reviews, args.ratings, args.users, args.seed)
+                database_url = args.database_url
+            else:
+                # Each app gets its own copy of the seeded file
+                path = os.path.join(workdir, f"{app_name}.db")
+                shutil.copy(template, path)
+                database_url = f"sqlite+aiosqlite:///{path}"
+            apps[app_name] = run_app(app_name, database_url, workdir, args)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'database': 'sqlite' if not args.database_url else args.database_url.split(':', 1)[0],
+        'scale': {'books': args.books, 'reviews': args.reviews, 'book_rating': args.ratings, 'users': args.users, 'seed': args.seed},
+        'seed_seconds': round(seed_seconds, 2),
+        'load': {'concurrency': args.concurrency, 'duration_seconds': args.duration, 'warmup_seconds': args.warmup},
+        'llm_stub': {'call_ms': args.llm_call_ms, 'token_ms': args.llm_token_ms, 'tokens': args.llm_tokens},
+        'apps': apps,
+    }
+
+def serve(args):
+    # Server side: import the app with the stub model registered in place of LLaMAQuick
+    import uvicorn
+
+    module = __import__(args.app)
+    module.registry.register("llm", lambda: StubLLaMA(args.llm_call_ms, args.llm_token_ms, args.llm_tokens))
+    uvicorn.run(module.app, host='127.0.0.1', port=args.port, log_level='warning')
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        parser = argparse.ArgumentParser()
+        parser.add_argument('command')
+        parser.add_argument('app', choices=APPS)
+        parser.add_argument('--port', type=int, required=True)
+        parser.add_argument('--llm-call-ms', type=float, default=50)
+        parser.add_argument('--llm-token-ms', type=float, default=2)
+        parser.add_argument('--llm-tokens', type=int, default=32)
+        return serve(parser.parse_args())
+
+    parser = argparse.ArgumentParser(description="Load test the HTTP APIs against a seeded database")
+    parser.add_argument('--apps', nargs='+', choices=APPS, default=APPS)
+    parser.add_argument('--routes', nargs='*', help="Only routes whose name contains one of these strings")
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--reviews', type=int, default=20000)
+    parser.add_argument('--ratings', type=int, default=20000, help="book_rating rows for the recommender")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5, help="Seconds of measured load per route")
+    parser.add_argument('--warmup', type=float, default=1, help="Seconds of unmeasured load before each route")
+    parser.add_argument('--timeout', type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--llm-call-ms', type=float, default=50, help="Stub model: fixed cost per generate call")
+    parser.add_argument('--llm-token-ms', type=float, default=2, help="Stub model: cost per generated token")
+    parser.add_argument('--llm-tokens', type=int, default=32, help="Stub model: tokens per answer")
+    parser.add_argument('--database-url', help="Seed and use this database instead of a temporary SQLite file")
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary directory (databases, server logs)")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Read-through cache for book records (plain dicts of the books columns), used by
+# BookManager.get_book_by_id and invalidated on update/delete. A read that missed
+# takes generation(key) before it queries the database and passes it to set();
+# an invalidation in between bumps the key's generation, and the set is dropped
+# (in-process) or the entry is never served (redis), so a read racing an update
+# cannot put the old row back. The storage is a pluggable backend:
+#   InProcessBookCacheBackend  bounded LRU with a TTL, private to one worker
+#   RedisBookCacheBackend      shared by every worker (needs the optional redis package)
+#   FakeRedis                  in-memory stand-in for the redis client, for tests
+class InProcessBookCacheBackend:
+    def __init__(self, max_entries=10000, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Invalidation clock and the tick each recently invalidated key was
+        # last invalidated at; a key dropped from that map counts as
+        # invalidated at _forgotten, the newest tick dropped
+        self._clock = 0
+        self._invalidated = OrderedDict()
+        self._forgotten = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_sets = 0
+
+    async def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, record = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return record
+
+    async def generation(self, key):
+        return self._clock
+
+    async def set(self, key, record, generation):
+        with self._lock:
+            if self._invalidated.get(key, self._forgotten) > generation:
+                # Invalidated after the read began: the record may be the old row
+                self.stale_sets += 1
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, record)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._clock += 1
+            self._invalidated[key] = self._clock
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.max_entries:
+                _, self._forgotten = self._invalidated.popitem(last=False)
+
+    def stats(self):
+        return {
+            'backend': 'memory',
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'stale_sets': self.stale_sets,
+        }
+
+# Size is bounded by the redis server's own maxmemory/LRU policy; entries carry a TTL.
+# Each entry is stored with the generation its read started at and is served only
+# while that is still the key's generation (one MGET), so every worker's
+# invalidation also covers reads in flight in the others. Generation keys outlive
+# the entries (twice the TTL), which keeps an old entry from matching again.
+class RedisBookCacheBackend:
+    def __init__(self, url=None, ttl_seconds=300, prefix='book:', client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("BOOK_CACHE_BACKEND=redis needs the redis package (pip install redis)")
+            client = redis.from_url(url or 'redis://localhost:6379/0')
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def get(self, key):
+        value, generation = await self.client.mget(f"{self.prefix}{key}", f"{self.prefix}{key}:generation")
+        if value is None:
+            return None
+        entry = json.loads(value)
+        if entry['generation'] != int(generation or 0):
+            return None
+        return entry['record']
+
+    async def generation(self, key):
+        return int(await self.client.get(f"{self.prefix}{key}:generation") or 0)
+
+    async def set(self, key, record, generation):
+        entry = {'generation': generation, 'record': record}
+        await self.client.set(f"{self.prefix}{key}", json.dumps(entry), ex=self.ttl_seconds)
+
+    async def delete(self, key):
+        # Bump first: a set that lands between the two calls is already stale
+        await self.client.incr(f"{self.prefix}{key}:generation")
+        await self.client.expire(f"{self.prefix}{key}:generation", 2 * self.ttl_seconds)
+        await self.client.delete(f"{self.prefix}{key}")
+
+    def stats(self):
+        return {'backend': 'redis', 'ttl_seconds': self.ttl_seconds}
+
+# The subset of the redis.asyncio client used above, kept in a dict
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, name):
+        entry = self.data.get(name)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[name]
+            return None
+        return value
+
+    async def mget(self, *names):
+        return [await self.get(name) for name in names]
+
+    async def set(self, name, value, ex=None):
+        self.data[name] = (value.encode() if isinstance(value, str) else value, time.monotonic() + ex if ex else None)
+
+    async def incr(self, name):
+        value = int(await self.get(name) or 0) + 1
+        expires_at = self.data[name][1] if name in self.data else None
+        self.data[name] = (str(value).encode(), expires_at)
+        return value
+
+    async def expire(self, name, seconds):
+        if name in self.data:
+            self.data[name] = (self.data[name][0], time.monotonic() + seconds)
+
+    async def delete(self, name):
+        self.data.pop(name, None)
+
+class BookCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, book_id):
+        record = await self.backend.get(book_id)
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return record
+
+    async def generation(self, book_id):
+        return await self.backend.generation(book_id)
+
+    async def set(self, book_id, record, generation):
+        await self.backend.set(book_id, record, generation)
+
+    async def invalidate(self, book_id):
+        self.invalidations += 1
+        await self.backend.delete(book_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            **self.backend.stats(),
+        }
+
+# backend: 'memory' (default), 'redis', 'fake' (tests) or 'none' to disable caching
+def make_book_cache(backend='memory', max_entries=10000, ttl_seconds=300, redis_url=None):
+    if backend == 'none':
+        return None
+    if backend == 'memory':
+        return BookCache(InProcessBookCacheBackend(max_entries, ttl_seconds))
+    if backend == 'redis':
+        return BookCache(RedisBookCacheBackend(redis_url, ttl_seconds))
+    if backend == 'fake':
+        return BookCache(RedisBookCacheBackend(ttl_seconds=ttl_seconds, client=FakeRedis()))
+    raise ValueError(f"Unknown book cache backend {backend!r}")
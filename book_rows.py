@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+from typing import Optional
+from pydantic import BaseModel
+from models import Book, Review
+
+# Read-only rows for the list/lookup endpoints. They are filled straight from a
+# Core select over these explicit columns (no ORM identity map or change
+# tracking), use __slots__ to stay small, and orjson serializes them natively.
+BOOK_COLUMNS = (Book.id, Book.title, Book.author, Book.genre, Book.year_published, Book.summary, Book.summary_status)
+REVIEW_COLUMNS = (Review.id, Review.book_id, Review.user_id, Review.review_text, Review.rating)
+
+# Field order matches BOOK_COLUMNS, so BookRow(*row) maps a result row
+@dataclass
+class BookRow:
+    __slots__ = ('id', 'title', 'author', 'genre', 'year_published', 'summary', 'summary_status')
+    id: int
+    title: str
+    author: str
+    genre: str
+    year_published: int
+    summary: Optional[str]
+    summary_status: Optional[str]
+
+# Field order matches REVIEW_COLUMNS
+@dataclass
+class ReviewRow:
+    __slots__ = ('id', 'book_id', 'user_id', 'review_text', 'rating')
+    id: int
+    book_id: int
+    user_id: int
+    review_text: str
+    rating: Optional[float]
+
+# Response models for the API docs; the routes return ORJSONResponse directly,
+# so these are not used to validate or re-encode each row
+class BookOut(BaseModel):
+    id: int
+    title: str
+    author: str
+    genre: str
+    year_published: int
+    summary: Optional[str]
+    summary_status: Optional[str]
+
+class ReviewOut(BaseModel):
+    id: int
+    book_id: int
+    user_id: int
+    review_text: str
+    rating: Optional[float]
+
+class SearchResultOut(BaseModel):
+    score: float
+    book: BookOut
+
+class SimilarBookOut(BaseModel):
+    similarity: float
+    book: BookOut
@@ -0,0 +1,129 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from sqlalchemy import select
+from models import Book, BOOK_SEARCH_INDEX_DDL
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+# In-process full-text index over title, author and summary, used when the
+# database has no full-text search of its own (Postgres uses the GIN index
+# defined in models.py instead). Postings map term -> {book_id: term frequency},
+# so a query only touches the posting lists of its own terms and is scored with
+# BM25. BookManager keeps it current on add/update/delete.
+class BookSearchIndex:
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_terms = {}
+        self.total_length = 0
+        self.lock = threading.Lock()
+        self._loading = False
+        self._touched = set()
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def load(self, engine, chunk_size=10000):
+        # Initial build from the books table (run on a worker thread). Books written
+        # while the load is running are indexed by add()/remove() directly and are
+        # skipped here, so a stale row from the load never overwrites them.
+        with self.lock:
+            self._loading = True
+            self._touched.clear()
+        query = select(Book.id, Book.title, Book.author, Book.summary)
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(query)
+            for rows in result.partitions(chunk_size):
+                with self.lock:
+                    for book_id, title, author, summary in rows:
+                        if book_id not in self._touched:
+                            self._add(book_id, title, author, summary)
+        with self.lock:
+            self._loading = False
+            self._touched.clear()
+        print(f"Search index built with {len(self)} books")
+        return self
+
+    def add(self, book_id, title, author, summary):
+        # Also used for updates: the previous version of the book is replaced
+        with self.lock:
+            if self._loading:
+                self._touched.add(book_id)
+            self._add(book_id, title, author, summary)
+
+    def add_many(self, books):
+        # books: [(book_id, title, author, summary)]
+        with self.lock:
+            for book_id, title, author, summary in books:
+                if self._loading:
+                    self._touched.add(book_id)
+                self._add(book_id, title, author, summary)
+
+    def remove(self, book_id):
+        with self.lock:
+            if self._loading:
+                self._touched.add(book_id)
+            self._remove(book_id)
+
+    def search(self, query, limit=20):
+        # [(book_id, score)], best match first
+        terms = set(tokenize(query))
+        with self.lock:
+            doc_count = len(self.doc_terms)
+            if not terms or not doc_count:
+                return []
+            average_length = self.total_length / doc_count
+            scores = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for book_id, frequency in postings.items():
+                    length = self.doc_terms[book_id][1]
+                    norm = self.K1 * (1 - self.B + self.B * length / average_length)
+                    scores[book_id] = scores.get(book_id, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def _add(self, book_id, title, author, summary):
+        self._remove(book_id)
+        tokens = tokenize(title) + tokenize(author) + tokenize(summary)
+        counts = Counter(tokens)
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[book_id] = frequency
+        self.doc_terms[book_id] = (tuple(counts), len(tokens))
+        self.total_length += len(tokens)
+
+    def _remove(self, book_id):
+        entry = self.doc_terms.pop(book_id, None)
+        if entry is None:
+            return
+        terms, length = entry
+        for term in terms:
+            postings = self.postings[term]
+            del postings[book_id]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= length
+
+# Creates the Postgres GIN index on an existing database (new tables get it
+# when they are created): python book_search.py
+def main():
+    from database import sync_engine
+    if sync_engine.dialect.name != 'postgresql':
+        print("Not a Postgres database: search uses the in-process index, nothing to create")
+        return
+    with sync_engine.begin() as conn:
+        conn.execute(BOOK_SEARCH_INDEX_DDL)
+    print("Search index ix_books_search is in place")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+class ComponentNotReady(Exception):
+    pass
+
+# Heavy components (the LLM, the recommender) are registered with a factory and
+# built on a background thread after startup instead of at import time, so the
+# rest of the API can serve requests while they load. A component that fails to
+# load (database down at boot, flaky model download) is retried on a timer with
+# exponential backoff; until then get() reports the last error.
+class _Component:
+    def __init__(self, name, factory, ready_check):
+        self.name = name
+        self.factory = factory
+        self.ready_check = ready_check
+        self.instance = None
+        self.error = None
+        self.state = 'pending'
+        self.load_seconds = None
+        self.attempts = 0
+        self.next_retry_at = None
+        self.loaded = threading.Event()
+        self.lock = threading.Lock()
+
+class ComponentRegistry:
+    def __init__(self, retry_initial_seconds=5.0, retry_max_seconds=300.0):
+        self._components = {}
+        self.retry_initial_seconds = retry_initial_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+    def register(self, name, factory, ready_check=None):
+        # ready_check(instance) can report a component that exists but is not
+        # usable yet, e.g. a recommender still building its first snapshot
+        self._components[name] = _Component(name, factory, ready_check)
+
+    def load(self, name):
+        component = self._components[name]
+        with component.lock:
+            if component.state in ('loaded', 'loading'):
+                return component.instance
+            component.state = 'loading'
+            component.attempts += 1
+            component.next_retry_at = None
+        started = time.perf_counter()
+        try:
+            component.instance = component.factory()
+            component.error = None
+            component.state = 'loaded'
+        except Exception as e:
+            component.error = str(e)
+            component.state = 'failed'
+            delay = min(self.retry_max_seconds, self.retry_initial_seconds * 2 ** (component.attempts - 1))
+            component.next_retry_at = time.time() + delay
+            print(f"Component '{name}' failed to load (attempt {component.attempts}), retrying in {delay:g}s: {e}")
+            retry = threading.Timer(delay, self.load, (name,))
+            retry.daemon = True
+            retry.start()
+        component.load_seconds = time.perf_counter() - started
+        component.loaded.set()
+        return component.instance
+
+    def start_warm_up(self):
+        # Build every component on the default executor; call from a startup hook
+        loop = asyncio.get_running_loop()
+        for name in self._components:
+            loop.run_in_executor(None, self.load, name)
+
+    def get(self, name, timeout=0):
+        # timeout=0 never blocks (request handlers); None waits for the load (worker threads)
+        component = self._components[name]
+        if not component.loaded.wait(timeout):
+            raise ComponentNotReady(f"{name} is still loading")
+        if component.error is not None:
+            raise ComponentNotReady(f"{name} failed to load: {component.error}")
+        return component.instance
+
+    def is_ready(self, name):
+        return self._state(self._components[name]) == 'ready'
+
+    def proxy(self, name, timeout=None):
+        return ComponentProxy(self, name, timeout)
+
+    def _state(self, component):
+        if component.state != 'loaded':
+            return component.state
+        if component.ready_check is not None and not component.ready_check(component.instance):
+            return 'warming'
+        return 'ready'
+
+    def status(self):
+        return {
+            name: {
+                'state': self._state(component),
+                'load_seconds': round(component.load_seconds, 3) if component.load_seconds is not None else None,
+                'error': component.error,
+                'attempts': component.attempts,
+                'next_retry_at': component.next_retry_at,
+            }
+            for name, component in self._components.items()
+        }
+
+    def readiness(self, required=(), extra=None):
+        # Per-component report for a /readyz endpoint; `extra` adds checks done
+        # by the caller (e.g. the database) and `required` names the components
+        # that must be ready for the overall answer to be yes
+        components = self.status()
+        components.update(extra or {})
+        ready = all(components.get(name, {}).get('state') == 'ready' for name in required)
+        return ready, components
+
+# Stands in for a registered component; attribute access resolves it through the
+# registry, waiting for it to load (or for `timeout` seconds) on first use
+class ComponentProxy:
+    def __init__(self, registry, name, timeout=None):
+        self._registry = registry
+        self._name = name
+        self._timeout = timeout
+
+    def __getattr__(self, attr):
+        return getattr(self._registry.get(self._name, self._timeout), attr)
@@ -0,0 +1,159 @@
+import re
+import numpy as np
+import pandas as pd
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+REGEX_CHARS = frozenset(".^$*+?{}[]\\|()")
+
+# Inverted index from genre to book positions, with each posting list sorted by
+# AverageRating so a (genre, min_rating) query is a dictionary lookup plus a bisect.
+# Which genres a query matches is found through a second index, from the words
+# of the genre strings to the genres containing them.
+class GenreIndex:
+    MAX_CACHED_QUERIES = 1024
+
+    def __init__(self, genres, ratings):
+        genres = pd.Series(genres).reset_index(drop=True)
+        codes, uniques = pd.factorize(genres)
+        self._build(codes, list(uniques), ratings)
+
+    @classmethod
+    def from_codes(cls, codes, categories, ratings):
+        # Same index from already factorized genres (e.g. a categorical column)
+        index = cls.__new__(cls)
+        index._build(np.asarray(codes), list(categories), ratings)
+        return index
+
+    @classmethod
+    def from_arrays(cls, genres, bounds, sorted_ratings, order):
+        # Rebuilds the index from arrays() output without sorting again; the
+        # arrays may be read-only memory maps, postings are views into them
+        index = cls.__new__(cls)
+        index._set_postings(list(genres), bounds, sorted_ratings, order)
+        return index
+
+    def arrays(self):
+        # (genres, bounds, sorted_ratings, order): the posting lists laid end to end
+        parts = [self.postings[genre] for genre in self.genres]
+        bounds = np.zeros(len(parts) + 1, dtype=np.int64)
+        bounds[1:] = np.cumsum([len(members) for _, members in parts])
+        if not parts:
+            return self.genres, bounds, np.empty(0, np.float32), np.empty(0, np.intp)
+        sorted_ratings = np.concatenate([ratings for ratings, _ in parts])
+        order = np.concatenate([members for _, members in parts])
+        return self.genres, bounds, sorted_ratings, order
+
+    def patched(self, genres, codes, ratings, removed, removed_codes, added):
+        # New index after CompactBooks.apply_changes: positions in removed
+        # (whose old genre codes are removed_codes) leave their posting lists,
+        # positions in added join the list of their genre in codes. Only the
+        # genres touched are re-sorted; the others share this index's arrays.
+        removed = np.asarray(removed, dtype=np.intp)
+        added = np.asarray(added, dtype=np.intp)
+        touched = set(np.asarray(removed_codes).tolist()) | set(codes[added].tolist())
+        touched.discard(-1)
+
+        postings = dict(self.postings)
+        size = self.size
+        for code in sorted(touched):
+            genre = genres[code]
+            old_ratings, old_members = self.postings.get(genre, (np.empty(0, ratings.dtype), np.empty(0, np.intp)))
+            keep = ~np.isin(old_members, removed)
+            joining = added[codes[added] == code]
+            members = np.concatenate([old_members[keep], joining])
+            member_ratings = np.concatenate([old_ratings[keep], ratings[joining]])
+            order = np.lexsort((members, member_ratings))
+            postings[genre] = (member_ratings[order], members[order])
+            size += len(members) - len(old_members)
+
+        index = GenreIndex.__new__(GenreIndex)
+        index.genres = list(genres)
+        index.postings = postings
+        index.size = size
+        index._index_tokens()
+        return index
+
+    def _build(self, codes, genres, ratings):
+        ratings = np.asarray(ratings)
+        if ratings.dtype != np.float32:
+            ratings = ratings.astype(np.float64)
+        positions = np.arange(len(codes))
+
+        # Sort by genre, then rating ascending, then original position
+        order = np.lexsort((positions, ratings, codes))
+        bounds = np.searchsorted(codes[order], np.arange(len(genres) + 1))
+        self._set_postings(genres, bounds, ratings[order], order)
+
+    def _set_postings(self, genres, bounds, sorted_ratings, order):
+        self.genres = genres
+        self.size = len(order)
+        self.postings = {}
+        for code, genre in enumerate(genres):
+            start, end = bounds[code], bounds[code + 1]
+            self.postings[genre] = (sorted_ratings[start:end], order[start:end])
+        self._index_tokens()
+
+    def _index_tokens(self):
+        # token -> positions in self.genres of the genre strings containing it
+        self._token_genres = {}
+        for position, genre in enumerate(self.genres):
+            for token in set(TOKEN_PATTERN.findall(genre)):
+                self._token_genres.setdefault(token, []).append(position)
+        self._query_cache = {}
+
+    def matching_genres(self, genre):
+        # Same semantics as Series.str.contains (a regex search) on the lower-cased
+        # Genre column, but evaluated per distinct genre value, not per row.
+        query = genre.lower()
+        keys = self._query_cache.get(query)
+        if keys is None:
+            if REGEX_CHARS.isdisjoint(query):
+                keys = self._substring_matches(query)
+            else:
+                # e.g. "fantasy|horror": regex search over the distinct genres
+                pattern = re.compile(query)
+                keys = [value for value in self.genres if pattern.search(value)]
+            if len(self._query_cache) >= self.MAX_CACHED_QUERIES:
+                self._query_cache.clear()
+            self._query_cache[query] = keys
+        return keys
+
+    def _substring_matches(self, query):
+        # A genre containing the query contains each of its words inside one of
+        # its own words, so only genres with a word containing the query's
+        # longest word are candidates; the token scan runs over distinct words.
+        words = TOKEN_PATTERN.findall(query)
+        if not words:
+            return [value for value in self.genres if query in value]
+        word = max(words, key=len)
+        candidates = set()
+        for token, positions in self._token_genres.items():
+            if word in token:
+                candidates.update(positions)
+        return [self.genres[position] for position in sorted(candidates) if query in self.genres[position]]
+
+    def lookup(self, genre, min_rating, limit=None):
+        # Positions of books whose genre matches and whose rating is >= min_rating.
+        # Without a limit they come back in table order (as the old boolean filter did);
+        # with a limit, the top-k by rating are returned best first.
+        ratings_parts = []
+        position_parts = []
+        for key in self.matching_genres(genre):
+            ratings, members = self.postings[key]
+            # Compare at the ratings' own precision (float32 in a compact snapshot)
+            start = np.searchsorted(ratings, ratings.dtype.type(min_rating), side='left')
+            if limit is not None:
+                start = max(start, len(ratings) - limit)
+            ratings_parts.append(ratings[start:])
+            position_parts.append(members[start:])
+
+        if not position_parts:
+            return np.empty(0, dtype=np.intp)
+
+        positions = np.concatenate(position_parts)
+        if limit is None:
+            return np.sort(positions)
+
+        ratings = np.concatenate(ratings_parts)
+        best = np.lexsort((positions, -ratings))[:limit]
+        return positions[best]
@@ -0,0 +1,165 @@
+import json
+import os
+import numpy as np
+import scipy.sparse as sp
+
+# Blocks denser than this are ranked as dense arrays, a few rows at a time
+DENSE_FRACTION = 0.05
+DENSE_CELLS = 2 ** 24
+
+# Top-k columns of each row of a (queries x items) similarity block, best first,
+# keeping positive similarities only; `exclude` names each row's own column.
+# Returns (rows x k) column indices padded with -1 and the matching similarities.
+def top_k_from_block(block, k, exclude=None):
+    block = block.tocsr()
+    row_count, column_count = block.shape
+    neighbors = np.full((row_count, k), -1, dtype=np.int32)
+    similarities = np.zeros((row_count, k), dtype=np.float32)
+    if not block.nnz:
+        return neighbors, similarities
+    if exclude is not None:
+        exclude = np.asarray(exclude)
+
+    if block.nnz > DENSE_FRACTION * row_count * column_count:
+        # Most pairs are similar (e.g. text sharing common words): argpartition per row
+        width = min(k, column_count)
+        step = max(1, DENSE_CELLS // column_count)
+        for start in range(0, row_count, step):
+            dense = block[start:start + step].toarray()
+            if exclude is not None:
+                dense[np.arange(dense.shape[0]), exclude[start:start + step]] = 0
+            top = np.argpartition(-dense, width - 1, axis=1)[:, :width]
+            values = np.take_along_axis(dense, top, axis=1)
+            order = np.argsort(-values, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            values = np.take_along_axis(values, order, axis=1)
+            found = values > 0
+            neighbors[start:start + step, :width] = np.where(found, top, -1)
+            similarities[start:start + step, :width] = np.where(found, values, 0)
+        return neighbors, similarities
+
+    block = block.tocoo()
+    keep = block.data > 0
+    if exclude is not None:
+        keep &= block.col != exclude[block.row]
+    rows, columns, values = block.row[keep], block.col[keep], block.data[keep]
+
+    # Best first within each row, then the first k of every row
+    order = np.lexsort((-values, rows))
+    rows, columns, values = rows[order], columns[order], values[order]
+    row_starts = np.searchsorted(rows, np.arange(row_count))
+    rank = np.arange(len(rows)) - row_starts[rows]
+    top = rank < k
+    neighbors[rows[top], rank[top]] = columns[top]
+    similarities[rows[top], rank[top]] = values[top]
+    return neighbors, similarities
+
+# Item-item collaborative filtering over the reviews table. The user x book
+# rating matrix is kept sparse; every book's top-k most similar books (cosine
+# similarity of their rating columns) are precomputed in batched sparse matrix
+# products, so recommending for one user only touches the neighbour lists of the
+# books that user has rated.
+class ItemNeighbors:
+    def __init__(self, user_ids, book_ids, ratings, k=50, batch_size=2048):
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float32)
+
+        self.user_ids, user_rows = np.unique(user_ids, return_inverse=True)
+        self.book_ids, book_columns = np.unique(book_ids, return_inverse=True)
+        shape = (len(self.user_ids), len(self.book_ids))
+
+        # A user who reviewed the same book twice counts once, with the mean rating
+        totals = sp.csr_matrix((ratings, (user_rows, book_columns)), shape=shape, dtype=np.float32)
+        counts = sp.csr_matrix((np.ones_like(ratings), (user_rows, book_columns)), shape=shape, dtype=np.float32)
+        totals.sum_duplicates()
+        counts.sum_duplicates()
+        self.ratings = totals.copy()
+        if self.ratings.nnz:
+            self.ratings.data = totals.data / counts.data
+
+        rated = np.diff(self.ratings.indptr)
+        sums = np.asarray(self.ratings.sum(axis=1)).ravel()
+        self.user_means = np.divide(sums, rated, out=np.zeros(len(rated), dtype=np.float64), where=rated > 0)
+        self.rating_range = (float(self.ratings.data.min()), float(self.ratings.data.max())) if self.ratings.nnz else (0.0, 0.0)
+        self.k = k
+        self.neighbors, self.similarities = self._top_k_neighbors(self.ratings, k, batch_size)
+
+    @property
+    def review_count(self):
+        return self.ratings.nnz
+
+    ARRAYS = ('user_ids', 'book_ids', 'user_means', 'neighbors', 'similarities')
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        for name in ('data', 'indices', 'indptr'):
+            np.save(os.path.join(directory, f"ratings_{name}.npy"), getattr(self.ratings, name))
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'k': self.k, 'shape': list(self.ratings.shape), 'rating_range': list(self.rating_range)}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        # Memory-maps a saved model read-only instead of recomputing it
+        items = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(items, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode))
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        ratings = [np.load(os.path.join(directory, f"ratings_{name}.npy"), mmap_mode=mmap_mode) for name in ('data', 'indices', 'indptr')]
+        items.ratings = sp.csr_matrix(tuple(ratings), shape=tuple(meta['shape']), copy=False)
+        items.k = meta['k']
+        items.rating_range = tuple(meta['rating_range'])
+        return items
+
+    @staticmethod
+    def _top_k_neighbors(ratings, k, batch_size):
+        item_count = ratings.shape[1]
+        neighbors = np.full((item_count, k), -1, dtype=np.int32)
+        similarities = np.zeros((item_count, k), dtype=np.float32)
+        if not ratings.nnz:
+            return neighbors, similarities
+
+        norms = np.sqrt(np.asarray(ratings.multiply(ratings).sum(axis=0)).ravel())
+        norms[norms == 0] = 1.0
+        normalized = sp.csr_matrix(ratings.multiply(1.0 / norms[np.newaxis, :]), dtype=np.float32)
+        items = normalized.T.tocsr()
+
+        for start in range(0, item_count, batch_size):
+            # (batch x users) @ (users x items): cosine similarity of this batch to every book
+            block = items[start:start + batch_size] @ normalized
+            rows = np.arange(start, min(start + batch_size, item_count))
+            neighbors[rows], similarities[rows] = top_k_from_block(block, k, exclude=rows)
+        return neighbors, similarities
+
+    def recommend(self, user_id, limit=10):
+        # [(book_id, predicted_rating, support)] best first; [] for an unknown user.
+        # Prediction is the user's mean plus the similarity-weighted deviation of
+        # their ratings on the neighbouring books they have read.
+        row = np.searchsorted(self.user_ids, user_id)
+        if row >= len(self.user_ids) or self.user_ids[row] != user_id:
+            return []
+        start, end = self.ratings.indptr[row], self.ratings.indptr[row + 1]
+        rated = self.ratings.indices[start:end]
+        deviations = self.ratings.data[start:end] - self.user_means[row]
+
+        candidates = self.neighbors[rated]
+        weights = self.similarities[rated]
+        valid = candidates >= 0
+        candidates = candidates[valid]
+        weights = weights[valid]
+        if not len(candidates):
+            return []
+        deviations = np.broadcast_to(deviations[:, np.newaxis], valid.shape)[valid]
+
+        books, inverse = np.unique(candidates, return_inverse=True)
+        support = np.bincount(inverse, weights=weights)
+        predicted = self.user_means[row] + np.bincount(inverse, weights=weights * deviations) / support
+        predicted = np.clip(predicted, *self.rating_range)
+
+        unseen = ~np.isin(books, rated)
+        books, predicted, support = books[unseen], predicted[unseen], support[unseen]
+        order = np.lexsort((-support, -predicted))[:limit]
+        return [(int(self.book_ids[book]), float(predicted[i]), float(support[i])) for i, book in zip(order, books[order])]
@@ -0,0 +1,132 @@
+import time
+from transformers import AutoTokenizer, AutoModelForCausalLM
+import torch
+import metrics
+
+# Inference profiles for CPU deployments:
+#   quantize  - dynamic int8 quantization of the Linear layers (CPU only)
+#   num_beams - default beam width; 1 takes the greedy / sampling fast path
+#   do_sample - sample with temperature/top_p instead of decoding greedily
+INFERENCE_PROFILES = {
+    'quality': {'quantize': False, 'num_beams': 2, 'do_sample': False},
+    'balanced': {'quantize': False, 'num_beams': 1, 'do_sample': False},
+    'fast': {'quantize': True, 'num_beams': 1, 'do_sample': False},
+    'fast-sampling': {'quantize': True, 'num_beams': 1, 'do_sample': True},
+}
+
+# LLaMA Model Integration Class
+class LLaMAQuick:
+    def __init__(self, model_path, profile='quality', num_threads=None, warmup=True):
+        if profile not in INFERENCE_PROFILES:
+            raise ValueError(f"Unknown inference profile '{profile}', expected one of {sorted(INFERENCE_PROFILES)}")
+        self.model_path = model_path
+        self.profile = profile
+        self.settings = INFERENCE_PROFILES[profile]
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModelForCausalLM.from_pretrained(model_path).to(self.device)
+        self.model.eval()
+        if self.settings['quantize'] and self.device == 'cpu':
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        if warmup:
+            # First calls pay for kernel selection and allocator growth; do it before serving
+            self.generate_text("Warm-up", max_length=16)
+
+    @property
+    def model_identity(self):
+        # Distinguishes outputs of the same weights under different profiles (used by caches)
+        return f"{self.model_path}#{self.profile}"
+
+    def _generation_kwargs(self, num_beams):
+        num_beams = num_beams or self.settings['num_beams']
+        return {
+            'num_beams': num_beams,
+            'do_sample': self.settings['do_sample'],
+            'early_stopping': num_beams > 1,
+            'no_repeat_ngram_size': 2,
+            'temperature': 0.7,
+            'top_p': 0.9,
+        }
+
+    def generate_text(self, prompt, max_length=150, num_beams=None):
+        inputs = self.tokenizer(prompt, return_tensors='pt').to(self.device)
+        started = time.perf_counter()
+        with torch.no_grad():
+            output = self.model.generate(
+                inputs['input_ids'],
+                max_length=max_length,
+                **self._generation_kwargs(num_beams)
+            )
+        metrics.record_generation('single', 1, output.shape[1] - inputs['input_ids'].shape[1], time.perf_counter() - started)
+        generated_text = self.tokenizer.decode(output[0], skip_special_tokens=True)
+        return generated_text
+
+    def generate_batch(self, prompts, max_length=150, num_beams=None):
+        # Decoder-only models need left padding so each prompt ends where generation starts
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = 'left'
+        inputs = self.tokenizer(prompts, return_tensors='pt', padding=True).to(self.device)
+        prompt_lengths = inputs['attention_mask'].sum(dim=1).tolist()
+        padded_length = inputs['input_ids'].shape[1]
+
+        # max_length counts the prompt, so give the batch enough room for the
+        # shortest prompt and trim each row back to its own budget afterwards
+        started = time.perf_counter()
+        with torch.no_grad():
+            output = self.model.generate(
+                inputs['input_ids'],
+                attention_mask=inputs['attention_mask'],
+                max_length=max_length + padded_length - min(prompt_lengths),
+                pad_token_id=self.tokenizer.pad_token_id,
+                **self._generation_kwargs(num_beams)
+            )
+        # Rows that stopped early are padded to the longest one; count only real tokens
+        generated = int((output[:, padded_length:] != self.tokenizer.pad_token_id).sum())
+        metrics.record_generation('batch', len(prompts), generated, time.perf_counter() - started)
+        results = []
+        for row, prompt_length in zip(output, prompt_lengths):
+            tokens = row[padded_length - prompt_length:][:max_length]
+            results.append(self.tokenizer.decode(tokens, skip_special_tokens=True))
+        return results
+
+    def stream_text(self, prompt, max_length=150, cancel_event=None):
+        # Greedy decoding one token at a time on the KV cache, yielding text as it
+        # is produced. Beam search cannot emit anything before the sequence is
+        # finished, so streaming always decodes greedily. Setting cancel_event
+        # stops generation after the current token.
+        inputs = self.tokenizer(prompt, return_tensors='pt').to(self.device)
+        tokens = inputs['input_ids'][0].tolist()
+        prompt_length = len(tokens)
+        next_input = inputs['input_ids']
+        past = None
+        emitted = ''
+        started = time.perf_counter()
+        try:
+            with torch.no_grad():
+                while len(tokens) < max_length:
+                    if cancel_event is not None and cancel_event.is_set():
+                        return
+                    outputs = self.model(next_input, past_key_values=past, use_cache=True)
+                    past = outputs.past_key_values
+                    logits = outputs.logits[0, -1, :]
+                    # Same no_repeat_ngram_size=2 rule as generate_text
+                    banned = [b for a, b in zip(tokens, tokens[1:]) if a == tokens[-1]]
+                    if banned:
+                        logits[banned] = -float('inf')
+                    token_id = int(logits.argmax())
+                    if token_id == self.tokenizer.eos_token_id:
+                        return
+                    tokens.append(token_id)
+                    # Decode the whole continuation so multi-token characters and
+                    # leading spaces come out right, then emit only the new part
+                    text = self.tokenizer.decode(tokens[prompt_length:], skip_special_tokens=True)
+                    if len(text) > len(emitted):
+                        yield text[len(emitted):]
+                        emitted = text
+                    next_input = torch.tensor([[token_id]], device=self.device)
+        finally:
+            # Also counts streams stopped early by cancel_event or a closed generator
+            metrics.record_generation('stream', 1, len(tokens) - prompt_length, time.perf_counter() - started)
@@ -0,0 +1,106 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+# Dynamic micro-batching in front of LLaMAQuick. Prompts that arrive within
+# batch_window_ms of each other (up to max_batch_size) are padded together and
+# run through a single generate call on a dedicated thread. It exposes the same
+# generate_text() as LLaMAQuick, so it can be dropped in wherever the model is used.
+class BatchingLLaMA:
+    def __init__(self, llama_model, batch_window_ms=20, max_batch_size=8):
+        self.llama_model = llama_model
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._prompts = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._worker = threading.Thread(target=self._run, name='llm-batcher', daemon=True)
+        self._worker.start()
+
+    # Read through on demand, so the wrapped model may still be loading when this is built
+    @property
+    def model_path(self):
+        return getattr(self.llama_model, 'model_path', None)
+
+    @property
+    def model_identity(self):
+        return getattr(self.llama_model, 'model_identity', self.model_path)
+
+    def submit(self, prompt, max_length=150, num_beams=None):
+        future = Future()
+        self._queue.put((future, prompt, (max_length, num_beams), time.monotonic()))
+        return future
+
+    def generate_text(self, prompt, max_length=150, num_beams=None):
+        return self.submit(prompt, max_length, num_beams).result()
+
+    async def agenerate_text(self, prompt, max_length=150, num_beams=None):
+        return await asyncio.wrap_future(self.submit(prompt, max_length, num_beams))
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': batches,
+                'prompts': self._prompts,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'avg_batch_size': self._prompts / batches if batches else 0.0,
+                'avg_queue_wait_ms': 1000 * self._queue_wait_total / self._prompts if self._prompts else 0.0,
+                'max_queue_wait_ms': 1000 * self._queue_wait_max,
+                'batch_window_ms': 1000 * self.batch_window,
+                'max_batch_size': self.max_batch_size,
+            }
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            # Prompts with different generation settings cannot share a generate call
+            groups = {}
+            for future, prompt, params, enqueued in batch:
+                # Skip requests whose caller has already given up
+                if not future.set_running_or_notify_cancel():
+                    continue
+                groups.setdefault(params, []).append((future, prompt, enqueued))
+            for (max_length, num_beams), items in groups.items():
+                self._record(items, started)
+                try:
+                    results = self.llama_model.generate_batch([prompt for _, prompt, _ in items], max_length, num_beams)
+                except Exception as e:
+                    for future, _, _ in items:
+                        future.set_exception(e)
+                    continue
+                for (future, _, _), result in zip(items, results):
+                    future.set_result(result)
+
+    def _record(self, items, started):
+        with self._stats_lock:
+            self._batch_sizes[len(items)] += 1
+            self._prompts += len(items)
+            for _, _, enqueued in items:
+                wait = started - enqueued
+                self._queue_wait_total += wait
+                self._queue_wait_max = max(self._queue_wait_max, wait)
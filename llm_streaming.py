@@ -0,0 +1,55 @@
+import asyncio
+import json
+import threading
+from admission_gate import Overloaded
+
+_DONE = object()
+
+# Runs a blocking token generator (LLaMAQuick.stream_text) on a worker thread and
+# relays its output as Server-Sent Events. When the client goes away the
+# generator is told to stop, so abandoned streams do not keep burning CPU.
+# With an AdmissionGate the stream holds one of its slots while it generates.
+# The slot is taken inside the generator, so a response that never starts
+# streaming never holds one; a wait that times out ends the stream with an
+# error event carrying retry_after.
+async def sse_token_stream(llama_model, prompt, request, max_length=150, disconnect_poll=1.0, gate=None):
+    if gate is not None:
+        try:
+            await gate.acquire()
+        except Overloaded as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e), 'retry_after': e.retry_after})}\n\n"
+            return
+    loop = asyncio.get_running_loop()
+    tokens = asyncio.Queue()
+    cancel_event = threading.Event()
+
+    def produce():
+        try:
+            for token in llama_model.stream_text(prompt, max_length=max_length, cancel_event=cancel_event):
+                loop.call_soon_threadsafe(tokens.put_nowait, token)
+        except Exception as e:
+            loop.call_soon_threadsafe(tokens.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(tokens.put_nowait, _DONE)
+
+    loop.run_in_executor(None, produce)
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(tokens.get(), timeout=disconnect_poll)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                continue
+            if item is _DONE:
+                yield "event: done\ndata: {}\n\n"
+                return
+            if isinstance(item, Exception):
+                yield f"event: error\ndata: {json.dumps({'detail': str(item)})}\n\n"
+                return
+            yield f"data: {json.dumps({'token': item})}\n\n"
+    finally:
+        # Also reached when Starlette cancels the response on disconnect
+        cancel_event.set()
+        if gate is not None:
+            gate.release()
@@ -0,0 +1,240 @@
+import asyncio
+import contextvars
+import time
+from functools import wraps
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Process-wide metrics in prometheus_client's default registry (which also
+# carries its process and GC collectors), rendered by GET /metrics with
+# generate_latest(REGISTRY). Values that already live elsewhere (queue depths,
+# cache statistics) are read by AppCollector at scrape time instead of being
+# pushed on every change.
+
+# Response adds "; charset=utf-8"
+CONTENT_TYPE = CONTENT_TYPE_LATEST.replace('; charset=utf-8', '')
+
+# Seconds; wide enough for both SQL statements and LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+## Metrics
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template, until the last body byte is sent",
+    ("method", "route", "status"), buckets=DEFAULT_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests currently being served")
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed", ("engine",))
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "SQL statement execution time", ("engine",), buckets=DEFAULT_BUCKETS)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements executed while serving one request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500),
+)
+DB_SECONDS_PER_REQUEST = Histogram("db_time_per_request_seconds", "Time spent in SQL statements per request", ("route",), buckets=DEFAULT_BUCKETS)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time to get a connection from the pool (including connecting)", ("engine",), buckets=DEFAULT_BUCKETS,
+)
+BOOK_MANAGER_SECONDS = Histogram("book_manager_operation_seconds", "BookManager operation latency", ("operation",), buckets=DEFAULT_BUCKETS)
+LLM_CALLS = Counter("llm_generate_calls_total", "Model generate calls (a batch counts once)", ("mode",))
+LLM_PROMPTS = Counter("llm_prompts_total", "Prompts run through the model", ("mode",))
+LLM_TOKENS = Counter("llm_tokens_generated_total", "Tokens generated by the model", ("mode",))
+LLM_GENERATION_SECONDS = Counter("llm_generation_seconds_total", "Time spent generating", ("mode",))
+LLM_TOKENS_PER_SECOND = Gauge("llm_tokens_per_second", "Generation throughput of the most recent call", ("mode",))
+RECOMMENDER_STAGE_SECONDS = Histogram(
+    "recommender_stage_duration_seconds", "Recommender refresh stages (load, train, index, map, ...)", ("stage",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+RECOMMENDER_SNAPSHOT = Gauge("recommender_snapshot", "Current recommender snapshot (version, rows, built_at)", ("field",))
+
+## Hooks
+
+# Per-request SQL statement count and time, set by MetricsMiddleware
+_request_db = contextvars.ContextVar('request_db', default=None)
+
+def instrument_engine(engine, name):
+    # Statement count/time for a sync Engine (pass async_engine.sync_engine for an AsyncEngine)
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        DB_QUERIES.labels(name).inc()
+        DB_QUERY_SECONDS.labels(name).observe(elapsed)
+        request_db = _request_db.get()
+        if request_db is not None:
+            request_db[0] += 1
+            request_db[1] += elapsed
+
+def timed_pool_class(pool_class, name):
+    # Subclass of an SQLAlchemy pool class that times each checkout, i.e. the
+    # wait for a free connection (or for a new one to connect)
+    class TimedPool(pool_class):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                DB_POOL_CHECKOUT_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+    TimedPool.__name__ = TimedPool.__qualname__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+def timed(histogram, **labels):
+    # Decorator recording a call's duration (sync or async function); unlike
+    # prometheus_client's own time() decorator it awaits coroutines
+    def decorate(function):
+        child = histogram.labels(**labels) if labels else histogram
+
+        if asyncio.iscoroutinefunction(function):
+            @wraps(function)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - started)
+        else:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+# Scrape-time metrics of the app's components. Registered once; a later
+# register_app_metrics call replaces the components read (the last app to
+# set it up wins when both are imported in one process).
+class AppCollector:
+    def __init__(self):
+        self.components = None
+        self.llama_model = None
+        self.book_cache = None
+        self.summary_queue = None
+        self.llm_gate = None
+
+    def collect(self):
+        if self.components is None:
+            return
+        try:
+            metrics = self._metrics()
+        except Exception as e:
+            # A broken component must not take the whole scrape down
+            print(f"App metrics collection failed: {e}")
+            return
+        yield from metrics
+
+    def _metrics(self):
+        depths = GaugeMetricFamily("llm_queue_depth", "Prompts waiting for the model", labels=("queue",))
+        depths.add_metric(("llm_batcher",), self.llama_model.queue_depth())
+        if self.summary_queue is not None:
+            depths.add_metric(("summary_jobs",), self.summary_queue.queue_depth())
+
+        summary = self.llama_model.cache.stats()
+        lookups = {'summary': (summary['memory_hits'] + summary['disk_hits'], summary['misses'])}
+        if self.book_cache is not None:
+            lookups['book'] = (self.book_cache.hits, self.book_cache.misses)
+        hits = CounterMetricFamily("cache_hits", "Cache lookups answered from the cache", labels=("cache",))
+        misses = CounterMetricFamily("cache_misses", "Cache lookups that missed", labels=("cache",))
+        ratios = GaugeMetricFamily("cache_hit_ratio", "Share of cache lookups that hit, since start", labels=("cache",))
+        for cache, (hit_count, miss_count) in lookups.items():
+            hits.add_metric((cache,), hit_count)
+            misses.add_metric((cache,), miss_count)
+            if hit_count + miss_count:
+                ratios.add_metric((cache,), hit_count / (hit_count + miss_count))
+        metrics = [depths, hits, misses, ratios]
+
+        if self.llm_gate is not None:
+            stats = self.llm_gate.stats()
+            admission = GaugeMetricFamily("llm_admission_requests", "Requests holding or waiting for an LLM slot", labels=("state",))
+            admission.add_metric(("active",), stats['active'])
+            admission.add_metric(("queued",), stats['queued'])
+            outcomes = CounterMetricFamily("llm_admission_outcomes", "LLM requests by admission outcome", labels=("outcome",))
+            for outcome in ('admitted', 'rejected', 'timed_out', 'deadline_exceeded', 'disconnected'):
+                outcomes.add_metric((outcome,), stats[outcome])
+            metrics += [admission, outcomes]
+
+        load_seconds = GaugeMetricFamily(
+            "component_load_seconds", "Time each background component took to load (model, recommender, indexes)", labels=("component",),
+        )
+        for name, status in self.components.status().items():
+            if status['load_seconds'] is not None:
+                load_seconds.add_metric((name,), status['load_seconds'])
+        metrics.append(load_seconds)
+        return metrics
+
+APP_COLLECTOR = AppCollector()
+REGISTRY.register(APP_COLLECTOR)
+
+def register_app_metrics(components, llama_model, book_cache=None, summary_queue=None, llm_gate=None):
+    # llama_model is the app's CachedLLaMA(BatchingLLaMA), llm_gate its AdmissionGate
+    APP_COLLECTOR.components = components
+    APP_COLLECTOR.llama_model = llama_model
+    APP_COLLECTOR.book_cache = book_cache
+    APP_COLLECTOR.summary_queue = summary_queue
+    APP_COLLECTOR.llm_gate = llm_gate
+
+def record_generation(mode, prompts, tokens, seconds):
+    LLM_CALLS.labels(mode).inc()
+    LLM_PROMPTS.labels(mode).inc(prompts)
+    LLM_TOKENS.labels(mode).inc(tokens)
+    LLM_GENERATION_SECONDS.labels(mode).inc(seconds)
+    if seconds > 0:
+        LLM_TOKENS_PER_SECOND.labels(mode).set(tokens / seconds)
+
+def record_snapshot(snapshot):
+    RECOMMENDER_SNAPSHOT.labels('version').set(snapshot.version)
+    RECOMMENDER_SNAPSHOT.labels('rows').set(snapshot.books.row_count)
+    RECOMMENDER_SNAPSHOT.labels('built_at').set(snapshot.built_at)
+
+# Pure ASGI middleware (no BaseHTTPMiddleware, so streaming responses are not
+# buffered): latency per route template and SQL statements per request
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def _route(self, scope):
+        route = scope.get('route')
+        if route is not None:
+            return route.path
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            # Unmatched paths share one label so scanners cannot blow up the series count
+            return 'unmatched'
+        if self._route_paths is None:
+            self._route_paths = {
+                getattr(route, 'endpoint', None): route.path
+                for route in scope['app'].routes if hasattr(route, 'path')
+            }
+        return self._route_paths.get(endpoint, 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = [500]
+        request_db = [0, 0.0]
+        token = _request_db.set(request_db)
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            _request_db.reset(token)
+            route = self._route(scope)
+            HTTP_REQUEST_SECONDS.labels(scope['method'], route, status[0]).observe(time.perf_counter() - started)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(request_db[0])
+            DB_SECONDS_PER_REQUEST.labels(route).observe(request_db[1])
@@ -0,0 +1,31 @@
+from sqlalchemy import inspect, text
+from database import sync_engine
+from models import Base, BOOK_SEARCH_INDEX_DDL
+
+# Brings an existing database up to the current models: python migrate_schema.py
+# The apps never create or alter tables, so run this before deploying a version
+# whose models changed. Every step checks first, so it is safe to run each deploy.
+
+# Columns added to tables that already existed, with the DDL type and default
+# used for the rows already there: (table, column, definition)
+ADDED_COLUMNS = [
+    ('books', 'summary_status', "VARCHAR DEFAULT 'ready'"),
+    ('books', 'summary_owner', "VARCHAR"),
+    ('books', 'summary_lease_expires', "FLOAT"),
+]
+
+def main():
+    with sync_engine.begin() as conn:
+        # Tables that do not exist yet (e.g. book_rating_stats)
+        Base.metadata.create_all(conn)
+        for table, column, definition in ADDED_COLUMNS:
+            columns = {existing['name'] for existing in inspect(conn).get_columns(table)}
+            if column not in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+                print(f"Added {table}.{column}")
+        if conn.dialect.name == 'postgresql':
+            conn.execute(BOOK_SEARCH_INDEX_DDL)
+    print("Schema is up to date")
+
+if __name__ == "__main__":
+    main()
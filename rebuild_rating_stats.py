@@ -0,0 +1,19 @@
+import asyncio
+from database import AsyncSessionLocal, async_engine
+from models import BookRatingStats
+from asyn_book_manager import BookManager
+
+# Recomputes book_rating_stats from the reviews table, e.g. after a bulk import
+# of reviews or to repair drift: python rebuild_rating_stats.py
+# Also creates the table on databases that predate it; run it once before
+# deploying the version that writes the aggregates.
+async def main():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(BookRatingStats.__table__.create, checkfirst=True)
+    async with AsyncSessionLocal() as session:
+        book_manager = BookManager(session, None)
+        books = await book_manager.rebuild_rating_stats()
+        print(f"Rebuilt rating aggregates for {books} books")
+
+if __name__ == "__main__":
+    asyncio.run(main())
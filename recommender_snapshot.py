@@ -0,0 +1,430 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+import joblib
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import train_test_split
+from genre_index import GenreIndex
+
+RATING_COLUMNS = ['RatingDist1', 'RatingDist2', 'RatingDist3', 'RatingDist4', 'RatingDist5']
+# The only book_rating columns the recommender reads
+PROJECTED_COLUMNS = ['Name', 'Genre', 'Rating'] + RATING_COLUMNS
+
+def quote_column(name):
+    # Column names come from configuration, not from requests, but never let one break out of the quotes
+    if '"' in name:
+        raise ValueError(f"Invalid column name: {name!r}")
+    return f'"{name}"'
+
+def projection_query(key_column=None, watermark_column=None, deleted_column=None, changed_since=False):
+    # The projected columns, plus (aliased) the row key, change watermark and
+    # soft-delete flag when incremental refresh is configured. With
+    # changed_since the query takes a :since parameter and returns only rows
+    # changed at or after it; >= so rows sharing the last watermark value are
+    # not missed (applying one twice is harmless).
+    columns = [quote_column(column) for column in PROJECTED_COLUMNS]
+    for alias, column in (('__key', key_column), ('__watermark', watermark_column), ('__deleted', deleted_column)):
+        if column:
+            columns.append(f"{quote_column(column)} AS {alias}")
+    sql = "SELECT " + ", ".join(columns) + " FROM book_rating"
+    if changed_since:
+        sql += f" WHERE {quote_column(watermark_column)} >= :since"
+    return text(sql)
+
+PROJECTION_QUERY = projection_query()
+
+def _plain_value(value):
+    # numpy / pandas scalars back to the Python values a driver can bind
+    if hasattr(value, 'to_pydatetime'):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def encode_watermark(value):
+    if isinstance(value, datetime):
+        return {'datetime': value.isoformat()}
+    return value
+
+def decode_watermark(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['datetime'])
+    return value
+
+def _clean(df):
+    # Same cleaning as the old DataFrame path: rows without a usable rating
+    # distribution are dropped. Soft-deleted rows count as invalid too.
+    for column in RATING_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    valid = df[['Rating'] + RATING_COLUMNS].notna().all(axis=1).to_numpy()
+    if '__deleted' in df:
+        valid &= ~df['__deleted'].fillna(False).astype(bool).to_numpy()
+    return valid
+
+def _average_ratings(df):
+    return df[RATING_COLUMNS].to_numpy(dtype=np.float64).mean(axis=1).astype(np.float32)
+
+# The book_rating data the recommender needs, one numpy array per column:
+# genre as codes into a small category list, AverageRating as float32, and
+# names interned (each distinct name stored once, UTF-8, in one byte blob).
+# Every array can be a read-only memory map of a snapshot file.
+# With incremental refresh, keys holds each row's primary key, alive marks
+# rows not since deleted and watermark is the newest change loaded.
+class CompactBooks:
+    ARRAYS = ('genre_codes', 'ratings', 'name_codes', 'name_offsets', 'name_blob')
+    OPTIONAL_ARRAYS = ('keys', 'alive')
+
+    def __init__(self, genre_codes, genres, ratings, name_codes, name_offsets, name_blob, keys=None, alive=None, watermark=None):
+        self.genre_codes = genre_codes
+        self.genres = genres
+        self.ratings = ratings
+        self.name_codes = name_codes
+        self.name_offsets = name_offsets
+        self.name_blob = name_blob
+        self.keys = keys
+        self.alive = alive
+        self.watermark = watermark
+        # key -> position and name -> code, built on the first incremental refresh
+        # and handed on to each patched copy (only the refresher uses them)
+        self._positions = None
+        self._name_lookup = None
+
+    def __len__(self):
+        return len(self.ratings)
+
+    @property
+    def row_count(self):
+        return len(self) if self.alive is None else int(np.count_nonzero(self.alive))
+
+    @classmethod
+    def from_rows(cls, rows, columns=PROJECTED_COLUMNS):
+        # rows: tuples in the order of columns (a projection_query() result)
+        df = pd.DataFrame(rows, columns=columns)
+        watermark = None
+        if '__watermark' in df and df['__watermark'].notna().any():
+            watermark = _plain_value(df['__watermark'].max())
+        df = df[_clean(df)]
+
+        ratings = _average_ratings(df)
+        genre_codes, genres = pd.factorize(df['Genre'].str.lower(), sort=True)
+        name_codes, names = pd.factorize(df['Name'])
+        encoded = [str(name).encode('utf-8') for name in names]
+        name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        name_offsets[1:] = np.cumsum([len(name) for name in encoded])
+        keys = df['__key'].to_numpy(dtype=np.int64) if '__key' in df else None
+        return cls(
+            genre_codes.astype(np.int16 if len(genres) < 2 ** 15 else np.int32),
+            [str(genre) for genre in genres],
+            ratings,
+            name_codes.astype(np.int32),
+            name_offsets,
+            np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            keys=keys,
+            alive=None if keys is None else np.ones(len(keys), dtype=bool),
+            watermark=watermark,
+        )
+
+    def apply_changes(self, rows, columns):
+        # Copy with the changed rows (a changed_since projection_query() result)
+        # applied: updates are written at the row's position, new keys are
+        # appended, deleted or no longer valid rows are marked dead. Returns
+        # (books, removed, added) positions for GenreIndex.patched. The arrays
+        # and lookup dicts are copied, never modified, so this object (the
+        # snapshot being served) stays intact even if the new one is never
+        # published; the per-row work is proportional to the changes only.
+        if self.keys is None:
+            raise ValueError("Snapshot was built without row keys")
+        df = pd.DataFrame(rows, columns=columns)
+        if '__watermark' in df:
+            df = df.sort_values('__watermark', kind='stable')
+        # A key changed twice since the last refresh: its latest version wins
+        df = df.drop_duplicates('__key', keep='last')
+        watermark = self.watermark
+        if df['__watermark'].notna().any():
+            newest = _plain_value(df['__watermark'].max())
+            watermark = newest if watermark is None else max(watermark, newest)
+        valid = _clean(df)
+
+        positions = dict(self._key_positions())
+        keys = df['__key'].to_numpy(dtype=np.int64)
+        existing = np.fromiter((positions.get(key, -1) for key in keys.tolist()), dtype=np.int64, count=len(keys))
+        # Every changed row leaves the index; the valid ones come back with their new values
+        removed = existing[existing >= 0]
+        new_keys = keys[valid & (existing < 0)]
+        size = len(self) + len(new_keys)
+        targets = existing.copy()
+        targets[valid & (existing < 0)] = np.arange(len(self), size)
+        added = targets[valid]
+
+        genres = list(self.genres)
+        genre_codes_by_name = {genre: code for code, genre in enumerate(genres)}
+        changed_genres = df['Genre'].str.lower().to_numpy()[valid]
+        for genre in changed_genres:
+            # A missing genre gets code -1 and stays out of the index, as in from_rows
+            if isinstance(genre, str) and genre not in genre_codes_by_name:
+                genre_codes_by_name[genre] = len(genres)
+                genres.append(genre)
+        names, offsets, blob, name_lookup = self._intern([str(name) for name in df['Name'].to_numpy()[valid]])
+
+        genre_dtype = np.int16 if len(genres) < 2 ** 15 else np.int32
+        genre_codes = _extended(self.genre_codes, size, genre_dtype)
+        ratings = _extended(self.ratings, size)
+        name_codes = _extended(self.name_codes, size)
+        all_keys = _extended(self.keys, size)
+        alive = _extended(self.alive, size)
+        genre_codes[added] = [genre_codes_by_name.get(genre, -1) if isinstance(genre, str) else -1 for genre in changed_genres]
+        ratings[added] = _average_ratings(df[valid])
+        name_codes[added] = names
+        all_keys[len(self):] = new_keys
+        alive[removed] = False
+        alive[added] = True
+
+        for key in keys[~valid].tolist():
+            positions.pop(key, None)
+        positions.update(zip(new_keys.tolist(), range(len(self), size)))
+
+        books = CompactBooks(genre_codes, genres, ratings, name_codes, offsets, blob, keys=all_keys, alive=alive, watermark=watermark)
+        books._positions = positions
+        books._name_lookup = name_lookup
+        return books, removed, added
+
+    def _key_positions(self):
+        if self._positions is None:
+            self._positions = dict(zip(self.keys.tolist(), range(len(self.keys))))
+            for position in np.flatnonzero(~self.alive).tolist():
+                self._positions.pop(int(self.keys[position]), None)
+        return self._positions
+
+    def _intern(self, names):
+        # Codes for names, appending the ones not seen yet to the blob; new
+        # names go into a copy of the lookup, returned with the new blob
+        if self._name_lookup is None:
+            blob = bytes(self.name_blob)
+            offsets = self.name_offsets
+            self._name_lookup = {
+                blob[offsets[code]:offsets[code + 1]].decode('utf-8'): code
+                for code in range(len(offsets) - 1)
+            }
+        lookup = self._name_lookup
+        codes = []
+        copied = False
+        appended = []
+        next_code = len(self.name_offsets) - 1
+        for name in names:
+            code = lookup.get(name)
+            if code is None:
+                if not copied:
+                    lookup = dict(lookup)
+                    copied = True
+                code = lookup[name] = next_code
+                next_code += 1
+                appended.append(name.encode('utf-8'))
+            codes.append(code)
+        if not appended:
+            return codes, self.name_offsets, self.name_blob, lookup
+        lengths = np.cumsum([len(name) for name in appended]) + self.name_offsets[-1]
+        offsets = np.concatenate([self.name_offsets, lengths])
+        blob = np.concatenate([self.name_blob, np.frombuffer(b''.join(appended), dtype=np.uint8)])
+        return codes, offsets, blob, lookup
+
+    def names(self, positions):
+        blob = self.name_blob
+        offsets = self.name_offsets
+        return [
+            bytes(blob[offsets[code]:offsets[code + 1]]).decode('utf-8')
+            for code in self.name_codes[positions]
+        ]
+
+    def to_frame(self):
+        # Full DataFrame view (Name, Genre, AverageRating), for inspection
+        positions = np.arange(len(self)) if self.alive is None else np.flatnonzero(self.alive)
+        return pd.DataFrame({
+            'Name': self.names(positions),
+            'Genre': pd.Categorical.from_codes(self.genre_codes[positions], self.genres),
+            'AverageRating': self.ratings[positions],
+        })
+
+    def save(self, directory, previous=None, previous_directory=None):
+        # previous: the books saved in previous_directory that these were
+        # patched from; arrays they still share are linked, not written again
+        for name in self.ARRAYS + self.OPTIONAL_ARRAYS:
+            array = getattr(self, name)
+            if array is None:
+                continue
+            if previous is not None and getattr(previous, name) is array and _share(previous_directory, directory, f"{name}.npy"):
+                continue
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        with open(os.path.join(directory, 'genres.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.genres, f)
+        if self.watermark is not None:
+            with open(os.path.join(directory, 'watermark.json'), 'w', encoding='utf-8') as f:
+                json.dump(encode_watermark(self.watermark), f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        for name in cls.OPTIONAL_ARRAYS:
+            path = os.path.join(directory, f"{name}.npy")
+            arrays[name] = np.load(path, mmap_mode=mmap_mode) if os.path.exists(path) else None
+        with open(os.path.join(directory, 'genres.json'), encoding='utf-8') as f:
+            genres = json.load(f)
+        watermark = None
+        if os.path.exists(os.path.join(directory, 'watermark.json')):
+            with open(os.path.join(directory, 'watermark.json'), encoding='utf-8') as f:
+                watermark = decode_watermark(json.load(f))
+        return cls(genres=genres, watermark=watermark, **arrays)
+
+def _share(source_directory, directory, name):
+    # Saved builds are never modified, so a file that did not change is hard
+    # linked from the previous build; False when it has to be written after all
+    source = os.path.join(source_directory, name)
+    target = os.path.join(directory, name)
+    try:
+        if os.path.isdir(source):
+            shutil.copytree(source, target, copy_function=os.link)
+        else:
+            os.link(source, target)
+        return True
+    except OSError:
+        # Previous build already removed, or no hard links on this file system
+        shutil.rmtree(target, ignore_errors=True)
+        return False
+
+def _extended(array, size, dtype=None):
+    # Writable copy of array grown to size (also detaches it from a read-only memory map)
+    extended = np.zeros(size, dtype=dtype or array.dtype)
+    extended[:len(array)] = array
+    return extended
+
+def build_genre_index(books):
+    return GenreIndex.from_codes(books.genre_codes, books.genres, books.ratings)
+
+def fit_rating_model(books):
+    # Genre codes are sorted like LabelEncoder's, so this is the same model as before
+    X = books.genre_codes.reshape(-1, 1)
+    y = books.ratings
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    model = RandomForestRegressor(n_estimators=100, random_state=42)
+    model.fit(X_train, y_train)
+    return model
+
+# Snapshot files shared by every worker on the host. Each build goes into its
+# own directory and CURRENT is switched to it atomically, so a worker maps
+# either the old or the new snapshot, never a partial one. Only the worker
+# holding the build lock rebuilds; the others wait for it and map the result.
+class SnapshotStore:
+    KEEP_BUILDS = 2
+
+    def __init__(self, directory, lock_timeout=600):
+        self.directory = directory
+        self.lock_timeout = lock_timeout
+        self.lock_path = os.path.join(directory, 'build.lock')
+        os.makedirs(directory, exist_ok=True)
+
+    def current(self):
+        # (path, metadata) of the latest complete snapshot, or None
+        try:
+            with open(os.path.join(self.directory, 'CURRENT'), encoding='utf-8') as f:
+                name = f.read().strip()
+            path = os.path.join(self.directory, name)
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                return path, json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def fresh(self, max_age):
+        current = self.current()
+        if current is not None and time.time() - current[1]['built_at'] < max_age:
+            return current
+        return None
+
+    def acquire(self):
+        # Cross-process build lock (an exclusively created file); a lock older
+        # than lock_timeout is treated as left behind by a crashed worker
+        try:
+            fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(self.lock_path) > self.lock_timeout:
+                    os.remove(self.lock_path)
+                    return self.acquire()
+            except OSError:
+                pass
+            return False
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        return True
+
+    def release(self):
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+    def wait_for_build(self, poll=0.5):
+        # Blocks until the worker holding the lock finishes (or gives up)
+        deadline = time.time() + self.lock_timeout
+        while os.path.exists(self.lock_path) and time.time() < deadline:
+            time.sleep(poll)
+        return self.current()
+
+    def save(self, version, books, index, model, items, previous=None, previous_path=None):
+        # previous: the (books, index, model, items) saved at previous_path that
+        # an incremental refresh patched. The model, item neighbours and any
+        # book arrays it left alone are linked from there; the per-row arrays
+        # and the index it changed are always written in full.
+        name = f"v{version}-{int(time.time() * 1000)}"
+        path = os.path.join(self.directory, name)
+        os.makedirs(path)
+        if previous is None:
+            previous = (None, None, None, None)
+        books.save(path, previous[0], previous_path)
+        genres, bounds, sorted_ratings, order = index.arrays()
+        np.save(os.path.join(path, 'index_bounds.npy'), bounds)
+        np.save(os.path.join(path, 'index_ratings.npy'), sorted_ratings)
+        np.save(os.path.join(path, 'index_order.npy'), order)
+        if not (model is previous[2] and _share(previous_path, path, 'model.joblib')):
+            joblib.dump(model, os.path.join(path, 'model.joblib'))
+        if items is not None and not (items is previous[3] and _share(previous_path, path, 'items')):
+            items.save(os.path.join(path, 'items'))
+        built_at = time.time()
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'built_at': built_at, 'rows': books.row_count}, f)
+
+        pointer = os.path.join(self.directory, 'CURRENT.tmp')
+        with open(pointer, 'w', encoding='utf-8') as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(self.directory, 'CURRENT'))
+        self._remove_old_builds(name)
+        return path, built_at
+
+    def load(self, path, items_loader=None):
+        # Memory-maps a saved snapshot read-only: (books, index, model, items)
+        books = CompactBooks.load(path)
+        index = GenreIndex.from_arrays(
+            books.genres,
+            np.load(os.path.join(path, 'index_bounds.npy')),
+            np.load(os.path.join(path, 'index_ratings.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'index_order.npy'), mmap_mode='r'),
+        )
+        model = joblib.load(os.path.join(path, 'model.joblib'), mmap_mode='r')
+        items = None
+        if items_loader is not None and os.path.isdir(os.path.join(path, 'items')):
+            items = items_loader(os.path.join(path, 'items'))
+        return books, index, model, items
+
+    def _remove_old_builds(self, keep_name):
+        builds = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_dir() and entry.name.startswith('v')),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True,
+        )
+        for entry in builds[self.KEEP_BUILDS:]:
+            if entry.name != keep_name:
+                # Workers may still map an old build; on Windows that blocks the delete
+                shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from sqlalchemy.exc import SQLAlchemyError
+from models import Review
+from asyn_book_manager import BookManager
+
+# Write-behind buffer for review submissions. Reviews are queued in memory and
+# written by a single flusher as one multi-row insert (plus the matching rating
+# aggregate updates) every flush_interval_ms or as soon as max_batch_size rows
+# are waiting. Callers are only acknowledged after their batch has committed.
+class ReviewWriteBehind:
+    def __init__(self, session_factory, flush_interval_ms=50, max_batch_size=500):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._wakeup = None
+        self._task = None
+        self._closing = False
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush_rows = 0
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def submit(self, review_details):
+        if self._task is None or self._closing:
+            raise RuntimeError("Review writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((BookManager.review_row(review_details), future))
+        if len(self._pending) >= self.max_batch_size:
+            self._wakeup.set()
+        await future
+
+    async def stop(self):
+        # Refuse new reviews, then drain everything already buffered
+        self._closing = True
+        if self._task is None:
+            return
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    def stats(self):
+        return {
+            'buffer_depth': len(self._pending),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'rows_failed': self.rows_failed,
+            'last_flush_rows': self.last_flush_rows,
+            'avg_flush_ms': 1000 * self.flush_seconds_total / self.flushes if self.flushes else 0.0,
+            'max_flush_ms': 1000 * self.flush_seconds_max,
+            'flush_interval_ms': 1000 * self.flush_interval,
+            'max_batch_size': self.max_batch_size,
+        }
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._pending:
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:self.max_batch_size]
+                try:
+                    await self._flush(batch)
+                except Exception as e:
+                    # Not a rejected row but e.g. the database refusing connections
+                    # during a restart: fail what is left of this batch and keep
+                    # the flusher alive for the next one
+                    print(f"Review flush failed: {e!r}")
+                    self._fail(batch, e)
+            if self._closing:
+                return
+
+    async def _flush(self, batch):
+        started = time.perf_counter()
+        rows = [row for row, _ in batch]
+        try:
+            await self._write(rows)
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+            self.rows_written += len(rows)
+        except SQLAlchemyError:
+            # One bad review must not fail its neighbours: retry them one by one
+            for row, future in batch:
+                try:
+                    await self._write([row])
+                    self.rows_written += 1
+                    if not future.done():
+                        future.set_result(None)
+                except SQLAlchemyError as e:
+                    self.rows_failed += 1
+                    if not future.done():
+                        future.set_exception(e)
+        elapsed = time.perf_counter() - started
+        self.flushes += 1
+        self.last_flush_rows = len(rows)
+        self.flush_seconds_total += elapsed
+        self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    def _fail(self, batch, error):
+        for _, future in batch:
+            if not future.done():
+                self.rows_failed += 1
+                future.set_exception(error)
+
+    async def _write(self, rows):
+        async with self.session_factory() as session:
+            book_manager = BookManager(session, None)
+            await book_manager.insert_rows(Review, rows)
+            await book_manager.update_rating_stats([(row['book_id'], row['rating']) for row in rows])
+            await session.commit()
@@ -0,0 +1,249 @@
+import threading
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sqlalchemy import select
+from models import Book
+from item_similarity import top_k_from_block
+
+# "More like this" index over title + summary. Each book is a hashed TF-IDF
+# vector (no vocabulary to maintain) and its top-k most similar books are
+# precomputed, so a lookup is a read of one precomputed list.
+#
+# The index changes incrementally. Vectors are rows of an append-only matrix:
+# a new or updated book gets a new row, and the old row is zeroed in place.
+# A batch of new books costs one sparse product against the catalog, to find
+# their own neighbours and the books whose lists they now belong in. Removing
+# one recomputes only the lists that contained it, in a single batched product.
+# IDF weights are those current when a book's vector is computed; load()
+# rebuilds everything from scratch.
+#
+# All of this is CPU work: BookManager calls add_many()/remove() on a worker
+# thread, never on the event loop. load() computes the new index without
+# holding the lock, so lookups keep being served from the previous one, and
+# writes made meanwhile are queued (under a separate lock) and replayed.
+class SimilarBooksIndex:
+    MERGE_ROWS = 512
+
+    def __init__(self, k=10, n_features=2 ** 18, batch_size=1024):
+        self.k = k
+        self.batch_size = batch_size
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features, alternate_sign=False, norm=None, stop_words='english', dtype=np.float32
+        )
+        self.lock = threading.Lock()
+        self._changes_lock = threading.Lock()
+        self._reset()
+        self._loading = False
+        self._changes = {}
+
+    def _reset(self):
+        self.document_frequency = np.zeros(self.vectorizer.n_features, dtype=np.int64)
+        self.document_count = 0
+        self.rows = {}
+        self.row_books = np.empty(0, dtype=np.int64)
+        self.neighbors = np.empty((0, self.k), dtype=np.int32)
+        self.similarities = np.empty((0, self.k), dtype=np.float32)
+        self._main = sp.csr_matrix((0, self.vectorizer.n_features), dtype=np.float32)
+        self._recent = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def row_count(self):
+        return self._main.shape[0] + len(self._recent)
+
+    def load(self, engine, chunk_size=10000):
+        # Full build from the books table (run on a worker thread). Changes made
+        # while it runs are queued and replayed incrementally afterwards.
+        with self._changes_lock:
+            self._loading = True
+            self._changes.clear()
+        book_ids, documents = [], []
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(select(Book.id, Book.title, Book.summary))
+            for rows in result.partitions(chunk_size):
+                for book_id, title, summary in rows:
+                    book_ids.append(book_id)
+                    documents.append(self._document(title, summary))
+
+        built = SimilarBooksIndex(self.k, self.vectorizer.n_features, self.batch_size)
+        if documents:
+            counts = self.vectorizer.transform(documents)
+            built.document_frequency = np.bincount(counts.indices, minlength=self.vectorizer.n_features)
+            built.document_count = len(book_ids)
+            built._main = built._weight(counts)
+            built.row_books = np.asarray(book_ids, dtype=np.int64)
+            built.rows = {book_id: row for row, book_id in enumerate(book_ids)}
+            built.neighbors = np.full((len(book_ids), self.k), -1, dtype=np.int32)
+            built.similarities = np.zeros((len(book_ids), self.k), dtype=np.float32)
+            for start in range(0, len(book_ids), self.batch_size):
+                rows = np.arange(start, min(start + self.batch_size, len(book_ids)))
+                block = built._main[rows] @ built._main.T
+                built.neighbors[rows], built.similarities[rows] = top_k_from_block(block, self.k, exclude=rows)
+
+        with self.lock:
+            for name in ('document_frequency', 'document_count', 'rows', 'row_books', 'neighbors', 'similarities', '_main', '_recent'):
+                setattr(self, name, getattr(built, name))
+        # Replay what was written during the build; writes arriving meanwhile
+        # keep queueing until nothing is left
+        while True:
+            with self._changes_lock:
+                changes = list(self._changes.items())
+                self._changes.clear()
+                if not changes:
+                    self._loading = False
+                    break
+            removed = [book_id for book_id, document in changes if document is None]
+            added = [(book_id, document) for book_id, document in changes if document is not None]
+            with self.lock:
+                affected = [row for book_id in removed for row in self._remove(book_id)]
+                self._add_documents(added)
+                self._recompute(affected)
+        print(f"Similar-books index built with {len(self)} books")
+        return self
+
+    def add(self, book_id, title, author, summary):
+        # Also used for updates; author is not part of the document
+        self.add_many([(book_id, title, author, summary)])
+
+    def add_many(self, books):
+        # books: [(book_id, title, author, summary)], vectorized and scored as one batch
+        documents = [(book_id, self._document(title, summary)) for book_id, title, author, summary in books]
+        if not documents:
+            return
+        with self._changes_lock:
+            if self._loading:
+                self._changes.update(documents)
+                return
+        with self.lock:
+            self._add_documents(documents)
+
+    def remove(self, book_id):
+        with self._changes_lock:
+            if self._loading:
+                self._changes[book_id] = None
+                return
+        with self.lock:
+            self._recompute(self._remove(book_id))
+
+    def similar(self, book_id, limit=10):
+        # [(book_id, similarity)] best first; None if the book is not indexed
+        with self.lock:
+            row = self.rows.get(book_id)
+            if row is None:
+                return None
+            neighbors = self.neighbors[row, :limit]
+            similarities = self.similarities[row, :limit]
+            found = neighbors >= 0
+            return list(zip(self.row_books[neighbors[found]].tolist(), similarities[found].tolist()))
+
+    @staticmethod
+    def _document(title, summary):
+        return f"{title or ''} {summary or ''}"
+
+    def _weight(self, counts):
+        # Sublinear tf * smoothed idf, L2-normalized rows
+        weighted = counts.astype(np.float32).tocsr()
+        weighted.data = 1 + np.log(weighted.data)
+        idf = np.log((1 + self.document_count) / (1 + self.document_frequency[weighted.indices])) + 1
+        weighted.data *= idf.astype(np.float32)
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sp.csr_matrix(weighted.multiply(1 / norms[:, np.newaxis]), dtype=np.float32)
+
+    def _similarity_block(self, queries):
+        # queries @ every row, without restacking the catalog: the main matrix and
+        # the recently appended rows are multiplied separately
+        block = queries @ self._main.T
+        if self._recent:
+            block = sp.hstack([block, queries @ sp.vstack(self._recent, format='csr').T], format='csr')
+        return block
+
+    def _query_rows(self, rows):
+        main_rows = self._main.shape[0]
+        return sp.vstack([self._main[row] if row < main_rows else self._recent[row - main_rows] for row in rows], format='csr')
+
+    def _vector_row(self, row):
+        main_rows = self._main.shape[0]
+        if row < main_rows:
+            start, end = self._main.indptr[row], self._main.indptr[row + 1]
+            return self._main.indices[start:end], self._main.data[start:end]
+        vector = self._recent[row - main_rows]
+        return vector.indices, vector.data
+
+    def _grow(self, rows):
+        if rows <= len(self.row_books):
+            return
+        capacity = max(rows, 2 * len(self.row_books), 64)
+        extra = capacity - len(self.row_books)
+        self.row_books = np.concatenate([self.row_books, np.full(extra, -1, dtype=np.int64)])
+        self.neighbors = np.concatenate([self.neighbors, np.full((extra, self.k), -1, dtype=np.int32)])
+        self.similarities = np.concatenate([self.similarities, np.zeros((extra, self.k), dtype=np.float32)])
+
+    def _add_documents(self, documents):
+        # documents: [(book_id, document)]; replaces any current version of the books
+        documents = list(dict(documents).items())
+        if not documents:
+            return
+        affected = np.unique(np.concatenate([self._remove(book_id) for book_id, _ in documents]))
+        counts = self.vectorizer.transform([document for _, document in documents])
+        np.add.at(self.document_frequency, counts.indices, 1)
+        self.document_count += len(documents)
+        vectors = self._weight(counts)
+
+        first = self.row_count
+        if len(self._recent) + len(documents) > self.MERGE_ROWS:
+            self._main = sp.vstack([self._main, *self._recent, vectors], format='csr')
+            self._recent = []
+        else:
+            self._recent.extend(vectors[i] for i in range(len(documents)))
+        new_rows = np.arange(first, first + len(documents))
+        self._grow(first + len(documents))
+        for row, (book_id, _) in zip(new_rows, documents):
+            self.rows[book_id] = row
+            self.row_books[row] = book_id
+
+        for start in range(0, len(new_rows), self.batch_size):
+            batch = new_rows[start:start + self.batch_size]
+            block = self._similarity_block(vectors[batch - first]).tocsr()
+            self.neighbors[batch], self.similarities[batch] = top_k_from_block(block, self.k, exclude=batch)
+            self._offer(block.T.tocsr(), batch, first)
+        self._recompute(affected)
+
+    def _offer(self, columns, batch, first):
+        # columns: catalog row -> similarity to each book in batch. Merges the new
+        # books into the lists of older books whose k-th neighbour they beat.
+        best = np.asarray(columns.max(axis=1).todense()).ravel()
+        improved = np.nonzero((best[:first] > self.similarities[:first, -1]) & (self.row_books[:first] >= 0))[0]
+        for other in improved:
+            start, end = columns.indptr[other], columns.indptr[other + 1]
+            neighbors = np.concatenate([self.neighbors[other], batch[columns.indices[start:end]]])
+            similarities = np.concatenate([self.similarities[other], columns.data[start:end]])
+            order = np.argsort(-similarities, kind='stable')[:self.k]
+            self.neighbors[other] = np.where(similarities[order] > 0, neighbors[order], -1)
+            self.similarities[other] = np.maximum(similarities[order], 0)
+
+    def _remove(self, book_id):
+        # Zeroes the book's row and returns the rows whose lists referenced it
+        row = self.rows.pop(book_id, None)
+        if row is None:
+            return np.empty(0, dtype=np.int64)
+        indices, data = self._vector_row(row)
+        self.document_frequency[indices] -= 1
+        self.document_count -= 1
+        data[:] = 0
+        self.row_books[row] = -1
+        self.neighbors[row] = -1
+        self.similarities[row] = 0
+        return np.unique(np.nonzero(self.neighbors[:self.row_count] == row)[0])
+
+    def _recompute(self, rows):
+        rows = np.asarray([row for row in rows if self.row_books[row] >= 0], dtype=np.int64)
+        if not len(rows):
+            return
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            block = self._similarity_block(self._query_rows(batch))
+            self.neighbors[batch], self.similarities[batch] = top_k_from_block(block, self.k, exclude=batch)
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Content-addressed cache for generated summaries. Entries are keyed by a hash
+# of the prompt and every setting that changes the output, held in a bounded
+# in-memory LRU and optionally persisted in a SQLite file that survives restarts.
+# aget/aput answer memory hits on the event loop and do the SQLite reads and
+# writes in a worker thread; the memory and the disk have separate locks, so a
+# slow disk lookup never holds up a memory hit.
+class SummaryCache:
+    def __init__(self, max_entries=1024, disk_path=None):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("CREATE TABLE IF NOT EXISTS summary_cache (key TEXT PRIMARY KEY, summary TEXT NOT NULL)")
+            self._disk.commit()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(prompt, **params):
+        payload = json.dumps({'prompt': prompt, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        summary = self._get_memory(key)
+        if summary is None:
+            summary = self._get_disk(key)
+        return summary
+
+    async def aget(self, key):
+        summary = self._get_memory(key)
+        if summary is None and self._disk is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._get_disk, key)
+        if summary is None:
+            self._count_miss()
+        return summary
+
+    def put(self, key, summary):
+        with self._lock:
+            self._remember(key, summary)
+        self._put_disk(key, summary)
+
+    async def aput(self, key, summary):
+        with self._lock:
+            self._remember(key, summary)
+        if self._disk is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._put_disk, key, summary)
+
+    def _get_memory(self, key):
+        with self._lock:
+            summary = self._memory.get(key)
+            if summary is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return summary
+
+    def _get_disk(self, key):
+        # Counts the miss when the disk doesn't have it (or there is no disk)
+        row = None
+        if self._disk is not None:
+            with self._disk_lock:
+                row = self._disk.execute("SELECT summary FROM summary_cache WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, row[0])
+            return row[0]
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _put_disk(self, key, summary):
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute("INSERT OR REPLACE INTO summary_cache (key, summary) VALUES (?, ?)", (key, summary))
+                self._disk.commit()
+
+    def _remember(self, key, summary):
+        self._memory[key] = summary
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._memory),
+                'max_entries': self.max_entries,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'disk_enabled': self._disk is not None,
+            }
+
+# Wraps LLaMAQuick (or BatchingLLaMA) and answers repeated prompts from the cache
+class CachedLLaMA:
+    def __init__(self, llama_model, cache):
+        self.llama_model = llama_model
+        self.cache = cache
+
+    @property
+    def model_identity(self):
+        return getattr(self.llama_model, 'model_identity', getattr(self.llama_model, 'model_path', None))
+
+    def _key(self, prompt, max_length, num_beams):
+        return self.cache.make_key(prompt, max_length=max_length, num_beams=num_beams, model_path=self.model_identity)
+
+    def generate_text(self, prompt, max_length=150, num_beams=None):
+        key = self._key(prompt, max_length, num_beams)
+        summary = self.cache.get(key)
+        if summary is None:
+            summary = self.llama_model.generate_text(prompt, max_length, num_beams)
+            self.cache.put(key, summary)
+        return summary
+
+    async def agenerate_text(self, prompt, max_length=150, num_beams=None):
+        key = self._key(prompt, max_length, num_beams)
+        summary = await self.cache.aget(key)
+        if summary is None:
+            if hasattr(self.llama_model, 'agenerate_text'):
+                summary = await self.llama_model.agenerate_text(prompt, max_length, num_beams)
+            else:
+                loop = asyncio.get_running_loop()
+                summary = await loop.run_in_executor(None, self.llama_model.generate_text, prompt, max_length, num_beams)
+            await self.cache.aput(key, summary)
+        return summary
+
+    def stats(self):
+        stats = self.llama_model.stats() if hasattr(self.llama_model, 'stats') else {}
+        stats['cache'] = self.cache.stats()
+        return stats
+
+    def __getattr__(self, name):
+        # Anything else (queue_depth, submit, ...) goes to the wrapped model
+        if name == 'llama_model':
+            raise AttributeError(name)
+        return getattr(self.llama_model, name)
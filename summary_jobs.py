@@ -0,0 +1,235 @@
+import asyncio
+import math
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, update, or_
+from models import Book
+from asyn_book_manager import BookManager, update_book_indexes
+
+# Generates book summaries on a worker pool so the LLM never runs on the event loop.
+# The book row is committed first with summary_status='queued'; a job fills in the
+# summary (status 'ready') or records the failure (status 'failed') when it finishes.
+# Threads are used rather than processes so all workers share one loaded model;
+# torch releases the GIL while generating.
+# max_pending bounds the backlog (queued + running jobs); callers check is_full()
+# before committing a book and turn a full queue away with 429 + Retry-After (a
+# soft bound: requests already past the check can overshoot it slightly).
+#
+# Jobs live in memory, so each 'queued' row carries a lease: the queue that owns
+# it (one per process) and an expiry it keeps renewing while it runs. Rows whose
+# lease ran out belong to a process that is gone (crash, restart, recycled
+# worker) and are claimed by whichever queue sees them first; rows held by a
+# live sibling worker are left alone.
+class SummaryJobQueue:
+    MAX_TRACKED_JOBS = 10000
+
+    # Weight of the latest job in the running average of job duration
+    JOB_SECONDS_WEIGHT = 0.2
+
+    def __init__(self, session_factory, llama_model, workers=1, book_indexes=(), book_cache=None, max_pending=None, lease_seconds=300):
+        self.session_factory = session_factory
+        self.llama_model = llama_model
+        # In-process indexes over book text (search, similar books) to refresh
+        self.book_indexes = [index for index in book_indexes if index is not None]
+        self.book_cache = book_cache
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='summary-worker')
+        self.jobs = OrderedDict()
+        self._tasks = set()
+        self.max_pending = max_pending
+        self._job_seconds = None
+        self.owner = uuid.uuid4().hex
+        self.lease_seconds = lease_seconds
+        self._lease_task = None
+
+    def submit(self, book_id, prompt):
+        job_id = uuid.uuid4().hex
+        self.jobs[job_id] = {
+            'job_id': job_id,
+            'book_id': book_id,
+            'status': 'queued',
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+        }
+        self._forget_old_jobs()
+        task = asyncio.get_running_loop().create_task(self._run(job_id, prompt))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    def lease_values(self):
+        # Column values for a row this queue holds a job for
+        return {'summary_owner': self.owner, 'summary_lease_expires': time.time() + self.lease_seconds}
+
+    def start(self):
+        # Renews this queue's leases and picks up expired ones, starting now
+        self._lease_task = asyncio.get_running_loop().create_task(self._maintain_leases())
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+    def queue_depth(self):
+        # Jobs submitted and not finished yet (queued or running)
+        return len(self._tasks)
+
+    def free_slots(self):
+        if self.max_pending is None:
+            return None
+        return max(0, self.max_pending - len(self._tasks))
+
+    def is_full(self):
+        return self.free_slots() == 0
+
+    def retry_after(self):
+        # Seconds until a running job likely finishes and frees a slot
+        job_seconds = self._job_seconds or 1.0
+        return max(1, math.ceil(job_seconds / self.workers))
+
+    async def submit_pending(self, limit=100):
+        # Queue jobs for books stored without a summary, e.g. by the bulk loader,
+        # as many as the backlog has room for
+        free_slots = self.free_slots()
+        if free_slots is not None:
+            limit = min(limit, free_slots)
+        if limit <= 0:
+            return []
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(Book).filter_by(summary_status='pending').order_by(Book.id).limit(limit)
+            )
+            books = result.scalars().all()
+            await session.execute(
+                update(Book).where(Book.id.in_([book.id for book in books])).values(summary_status='queued', **self.lease_values())
+            )
+            await session.commit()
+        if self.book_cache is not None:
+            for book in books:
+                await self.book_cache.invalidate(book.id)
+        return [
+            self.submit(book.id, BookManager.summary_prompt(book.title, book.author, book.genre, book.year_published))
+            for book in books
+        ]
+
+    async def recover(self):
+        # Claims 'queued' rows whose lease expired, as many as the backlog has room
+        # for, and runs their jobs here. The claim is one conditional UPDATE, so
+        # two queues recovering at once never both get the same row.
+        limit = self.free_slots()
+        if limit == 0:
+            return []
+        now = time.time()
+        orphaned = (Book.summary_status == 'queued', or_(Book.summary_lease_expires.is_(None), Book.summary_lease_expires < now))
+        async with self.session_factory() as session:
+            candidates = select(Book.id).where(*orphaned).order_by(Book.id)
+            if limit is not None:
+                candidates = candidates.limit(limit)
+            await session.execute(
+                update(Book).where(Book.id.in_(candidates.scalar_subquery()), *orphaned)
+                .values(**self.lease_values()).execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            result = await session.execute(
+                select(Book).where(Book.summary_status == 'queued', Book.summary_owner == self.owner).order_by(Book.id)
+            )
+            running = {job['book_id'] for job in self.jobs.values() if job['finished_at'] is None}
+            books = [book for book in result.scalars().all() if book.id not in running]
+        if not books:
+            return []
+        print(f"Requeueing summaries for {len(books)} books left queued by a process that is gone")
+        return [
+            self.submit(book.id, BookManager.summary_prompt(book.title, book.author, book.genre, book.year_published))
+            for book in books
+        ]
+
+    async def _renew_leases(self):
+        async with self.session_factory() as session:
+            await session.execute(
+                update(Book).where(Book.summary_status == 'queued', Book.summary_owner == self.owner)
+                .values(summary_lease_expires=time.time() + self.lease_seconds)
+            )
+            await session.commit()
+
+    async def _maintain_leases(self):
+        while True:
+            try:
+                await self._renew_leases()
+                await self.recover()
+            except Exception as e:
+                print(f"Could not renew or recover summary job leases: {e}")
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    async def shutdown(self):
+        # Unfinished jobs are dropped: their leases are released so another
+        # process picks them up straight away instead of after the lease expires
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+        self.executor.shutdown(wait=False)
+        try:
+            async with self.session_factory() as session:
+                await session.execute(
+                    update(Book).where(Book.summary_status == 'queued', Book.summary_owner == self.owner)
+                    .values(summary_owner=None, summary_lease_expires=None)
+                )
+                await session.commit()
+        except Exception as e:
+            print(f"Could not release summary job leases: {e}")
+
+    def _generate(self, job_id, prompt):
+        self.jobs[job_id]['status'] = 'running'
+        self.jobs[job_id]['started_at'] = time.time()
+        return self.llama_model.generate_text(prompt)
+
+    async def _run(self, job_id, prompt):
+        job = self.jobs[job_id]
+        loop = asyncio.get_running_loop()
+        try:
+            summary = await loop.run_in_executor(self.executor, self._generate, job_id, prompt)
+            self._record_job_seconds(time.time() - job['started_at'])
+            await self._store(job['book_id'], summary=summary, summary_status='ready', summary_owner=None, summary_lease_expires=None)
+            job['status'] = 'done'
+            await self._reindex(job['book_id'])
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            try:
+                await self._store(job['book_id'], summary_status='failed', summary_owner=None, summary_lease_expires=None)
+            except Exception as store_error:
+                print(f"Could not mark summary for book ID {job['book_id']} as failed: {store_error}")
+        job['finished_at'] = time.time()
+        print(f"Summary job {job_id} for book ID {job['book_id']} {job['status']}")
+
+    def _record_job_seconds(self, seconds):
+        if self._job_seconds is None:
+            self._job_seconds = seconds
+        else:
+            self._job_seconds += self.JOB_SECONDS_WEIGHT * (seconds - self._job_seconds)
+
+    async def _store(self, book_id, **values):
+        async with self.session_factory() as session:
+            await session.execute(update(Book).where(Book.id == book_id).values(**values))
+            await session.commit()
+        if self.book_cache is not None:
+            await self.book_cache.invalidate(book_id)
+
+    async def _reindex(self, book_id):
+        # The generated summary is indexed text too
+        if not self.book_indexes:
+            return
+        async with self.session_factory() as session:
+            book = await session.get(Book, book_id)
+        if book is not None:
+            await update_book_indexes(self.book_indexes, 'add_many', [(book.id, book.title, book.author, book.summary)])
+
+    def _forget_old_jobs(self):
+        # Drop the oldest finished jobs once the table is full
+        while len(self.jobs) > self.MAX_TRACKED_JOBS:
+            for job_id, job in self.jobs.items():
+                if job['finished_at'] is not None:
+                    del self.jobs[job_id]
+                    break
+            else:
+                break